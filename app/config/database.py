@@ -1,6 +1,11 @@
 import os
+import inspect
+from functools import wraps
 from dotenv import load_dotenv
+from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import pymongo
@@ -15,6 +20,34 @@ engine = create_engine(POSTGRES_URI)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async PostgreSQL Configuration (asyncpg driver, selected with DB_ASYNC=true)
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 20))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 80))
+
+def _async_url(uri):
+    """
+    Convert the sync DB_URI into an asyncpg URL plus connect args.
+    asyncpg does not understand libpq's sslmode, so it is passed as ssl instead.
+    """
+    url = make_url(uri)
+    connect_args = {}
+    if "sslmode" in url.query:
+        connect_args["ssl"] = url.query["sslmode"]
+        url = url.difference_update_query(["sslmode"])
+    return url.set(drivername="postgresql+asyncpg"), connect_args
+
+ASYNC_POSTGRES_URI, _async_connect_args = _async_url(POSTGRES_URI)
+async_engine = create_async_engine(
+    ASYNC_POSTGRES_URI,
+    connect_args=_async_connect_args,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 # PostgreSQL Database dependency
 def get_db():
     db = SessionLocal()
@@ -23,9 +56,40 @@ def get_db():
     finally:
         db.close()
 
+# Async PostgreSQL Database dependency
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def session_endpoint(func):
+    """
+    Serve a handler written against a sync Session in the configured mode.
+
+    With DB_ASYNC disabled the handler is returned untouched and FastAPI runs it
+    in its worker thread pool. With DB_ASYNC enabled it is wrapped in an async
+    endpoint that receives an AsyncSession and runs the handler body through
+    AsyncSession.run_sync, so all database I/O goes through asyncpg on the event
+    loop and no thread pool slot is held while a query is in flight.
+    """
+    if not DB_ASYNC:
+        return func
+
+    signature = inspect.signature(func)
+    parameters = [
+        param.replace(default=Depends(get_async_db)) if param.name == "db" else param
+        for param in signature.parameters.values()
+    ]
+
+    @wraps(func)
+    async def endpoint(*args, db, **kwargs):
+        return await db.run_sync(lambda session: func(*args, db=session, **kwargs))
+
+    endpoint.__signature__ = signature.replace(parameters=parameters)
+    return endpoint
+
 # MongoDB Configuration
 MONGODB_URI = os.getenv("MONGODB_URI")
 mongo_client = pymongo.MongoClient(MONGODB_URI)
 mongodb = mongo_client.coffee_quality_db
 async_mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGODB_URI)
-async_mongodb = async_mongo_client.coffee_quality_db
\ No newline at end of file
+async_mongodb = async_mongo_client.coffee_quality_db
@@ -1,10 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
 import uvicorn
-from app.config.database import Base, engine
+from app.config.database import engine
+from app.models.schema import upgrade_schema
 from app.routers.api import router
+from app.routers.admin import router as admin_router
+from app.routers.changes import router as changes_router
+from app.routers.responses import default_response_class
+from app.routers.stats import router as stats_router
+from app.routers.stream import router as stream_router
+from app.services.events import DB_NOTIFY_ENABLED, ChangeListener
+from app.services.rollups import RollupRefresher
+from app.services.streams import ChangeStream
 
 # Configure logging
 logging.basicConfig(
@@ -14,14 +24,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create database tables and bring existing ones up to date
+upgrade_schema(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Listen for changes committed by other workers, keep the rollups fresh and fan
+    changes out to streaming clients while the app is running
+    """
+    listener = ChangeListener().start() if DB_NOTIFY_ENABLED else None
+    app.state.change_listener = listener
+    refresher = RollupRefresher().start()
+    app.state.rollup_refresher = refresher
+    app.state.change_stream = ChangeStream().start()
+    yield
+    app.state.change_stream.stop()
+    await refresher.stop()
+    if listener:
+        await listener.stop()
 
 # Initialize FastAPI
 app = FastAPI(
     title="Coffee Quality API",
     description="API for managing coffee quality data from the Coffee Quality Institute",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=default_response_class()
 )
 
 # Add CORS middleware
@@ -35,6 +64,10 @@ app.add_middleware(
 
 # Include routers
 app.include_router(router, prefix="/api")
+app.include_router(admin_router, prefix="/api/admin", tags=["Admin"])
+app.include_router(stats_router, prefix="/api/stats", tags=["Stats"])
+app.include_router(stream_router, prefix="/api/stream", tags=["Stream"])
+app.include_router(changes_router, prefix="/api", tags=["Changes"])
 
 @app.get("/", tags=["Root"])
 def read_root():
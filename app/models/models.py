@@ -1,10 +1,10 @@
 from datetime import datetime, date
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Float, ForeignKey, DateTime, Date, Text, Index, func, literal_column, text
 from sqlalchemy.orm import relationship
 from app.config.database import Base
 from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Optional, List, Dict, Union
 
 # SQLAlchemy Models
 class Country(Base):
@@ -14,8 +14,15 @@ class Country(Base):
     country_name = Column(String, unique=True, nullable=False)
     region = Column(String)
     continent = Column(String)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Transaction id of the last insert or update, set by a trigger (see app.services.changes)
+    change_xid = Column(BigInteger)
     
-    producers = relationship("Producer", back_populates="country", cascade="all, delete-orphan")
+    producers = relationship("Producer", back_populates="country", cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        Index("ix_countries_change_xid_id", "change_xid", "country_id"),
+    )
 
 class Producer(Base):
     __tablename__ = "producers"
@@ -30,9 +37,21 @@ class Producer(Base):
     certification_address = Column(String)
     certification_contact = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Transaction id of the last insert or update, set by a trigger (see app.services.changes)
+    change_xid = Column(BigInteger)
     
     country = relationship("Country", back_populates="producers")
-    coffees = relationship("Coffee", back_populates="producer", cascade="all, delete-orphan")
+    coffees = relationship("Coffee", back_populates="producer", cascade="all, delete-orphan", passive_deletes=True)
+    
+    # Natural key for upserts; a missing farm_name matches another missing farm_name
+    natural_key = (company_name, func.coalesce(farm_name, literal_column("''")), country_id)
+    
+    __table_args__ = (
+        Index("ix_producers_created_at_id", "created_at", "producer_id"),
+        Index("uq_producers_natural_key", *natural_key, unique=True),
+        Index("ix_producers_change_xid_id", "change_xid", "producer_id"),
+    )
 
 class Coffee(Base):
     __tablename__ = "coffees"
@@ -40,6 +59,7 @@ class Coffee(Base):
     coffee_id = Column(Integer, primary_key=True, index=True)
     producer_id = Column(Integer, ForeignKey("producers.producer_id", ondelete="CASCADE"))
     harvest_year = Column(Integer)
+    lot_number = Column(String)
     grading_date = Column(Date)
     variety = Column(String)
     processing_method = Column(String)
@@ -59,10 +79,22 @@ class Coffee(Base):
     total_cup_points = Column(Float)
     quality_classification = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Transaction id of the last insert or update, set by a trigger (see app.services.changes)
+    change_xid = Column(BigInteger)
     
     producer = relationship("Producer", back_populates="coffees")
-    cupping_scores = relationship("CuppingScore", back_populates="coffee", cascade="all, delete-orphan")
+    cupping_scores = relationship("CuppingScore", back_populates="coffee", cascade="all, delete-orphan", passive_deletes=True)
+    
+    # Natural key for upserts; coffees missing any part of it never match
+    natural_key = (producer_id, harvest_year, lot_number)
+    
+    __table_args__ = (
+        Index("ix_coffees_total_cup_points_id", "total_cup_points", "coffee_id"),
+        Index("ix_coffees_created_at_id", "created_at", "coffee_id"),
+        Index("uq_coffees_natural_key", *natural_key, unique=True),
+        Index("ix_coffees_change_xid_id", "change_xid", "coffee_id"),
+    )
 
 class CuppingScore(Base):
     __tablename__ = "cupping_scores"
@@ -85,8 +117,71 @@ class CuppingScore(Base):
     total_score = Column(Float)
     notes = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Transaction id of the last insert or update, set by a trigger (see app.services.changes)
+    change_xid = Column(BigInteger)
     
     coffee = relationship("Coffee", back_populates="cupping_scores")
+    
+    __table_args__ = (
+        Index("ix_cupping_scores_total_score_id", "total_score", "score_id"),
+        Index("ix_cupping_scores_created_at_id", "created_at", "score_id"),
+        Index("ix_cupping_scores_change_xid_id", "change_xid", "score_id"),
+    )
+
+class JobProgress(Base):
+    __tablename__ = "job_progress"
+    
+    job_name = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    last_id = Column(Integer, nullable=False, default=0)
+    target_id = Column(Integer)
+    rows_changed = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime)
+    
+    @property
+    def percent_complete(self):
+        if self.status == "finished":
+            return 100.0
+        if not self.target_id:
+            return 0.0
+        return round(min(self.last_id / self.target_id, 1.0) * 100, 1)
+
+# Running count, mean and sum of squared deviations (m2) of one cupping attribute
+# over a coffee's cupping scores
+class CuppingAggregate(Base):
+    __tablename__ = "cupping_aggregates"
+    
+    coffee_id = Column(Integer, ForeignKey("coffees.coffee_id", ondelete="CASCADE"), primary_key=True)
+    attribute = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0)
+    m2 = Column(Float, nullable=False, default=0)
+
+# A deleted row of a synced table, recorded by a trigger so the changes feed can
+# report deletes
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+    
+    tombstone_id = Column(BigInteger, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    change_xid = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, server_default=text("(now() AT TIME ZONE 'utc')"))
+    
+    __table_args__ = (
+        Index("ix_tombstones_change_xid_id", "change_xid", "tombstone_id"),
+    )
+
+class RollupRefresh(Base):
+    __tablename__ = "rollup_refreshes"
+    
+    name = Column(String, primary_key=True)
+    refreshed_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Float)
 
 # Pydantic Schemas
 class CountryBase(BaseModel):
@@ -102,8 +197,13 @@ class CountryUpdate(BaseModel):
     region: Optional[str] = None
     continent: Optional[str] = None
 
+class CountryUpsert(BaseModel):
+    region: Optional[str] = None
+    continent: Optional[str] = None
+
 class CountryResponse(CountryBase):
     country_id: int
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -134,6 +234,7 @@ class ProducerUpdate(BaseModel):
 class ProducerResponse(ProducerBase):
     producer_id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -141,6 +242,7 @@ class ProducerResponse(ProducerBase):
 class CoffeeBase(BaseModel):
     producer_id: int
     harvest_year: Optional[int] = None
+    lot_number: Optional[str] = None
     grading_date: Optional[date] = None
     variety: Optional[str] = None
     processing_method: Optional[str] = None
@@ -164,6 +266,7 @@ class CoffeeCreate(CoffeeBase):
 class CoffeeUpdate(BaseModel):
     producer_id: Optional[int] = None
     harvest_year: Optional[int] = None
+    lot_number: Optional[str] = None
     grading_date: Optional[date] = None
     variety: Optional[str] = None
     processing_method: Optional[str] = None
@@ -191,6 +294,29 @@ class CoffeeResponse(CoffeeBase):
     class Config:
         from_attributes = True
 
+class BulkCoffeeRowResult(BaseModel):
+    index: int
+    status: str
+    coffee_id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkCoffeeResponse(BaseModel):
+    created: int
+    rejected: int
+    results: List[BulkCoffeeRowResult]
+
+class BulkUpsertRowResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkUpsertResponse(BaseModel):
+    inserted: int
+    updated: int
+    rejected: int
+    results: List[BulkUpsertRowResult]
+
 class CuppingScoreBase(BaseModel):
     coffee_id: int
     cupper_name: Optional[str] = None
@@ -231,6 +357,81 @@ class CuppingScoreResponse(CuppingScoreBase):
     score_id: int
     total_score: Optional[float] = None
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class CuppingSessionCreate(BaseModel):
+    tasting_date: Optional[date] = None
+    scores: List[CuppingScoreCreate]
+
+class CuppingSessionResponse(BaseModel):
+    created: int
+    coffees: int
+    scores: List[CuppingScoreResponse]
+
+class BatchGetRequest(BaseModel):
+    ids: List[int]
+
+class JobProgressResponse(BaseModel):
+    job_name: str
+    status: str
+    last_id: int
+    target_id: Optional[int] = None
+    rows_changed: int
+    percent_complete: float
+    error: Optional[str] = None
+    started_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class MetricStats(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    stddev: Optional[float] = None
+    percentiles: Dict[str, Optional[float]] = {}
+
+class StatsGroup(BaseModel):
+    group: Dict[str, Union[int, str, None]]
+    count: int
+    metrics: Dict[str, MetricStats]
+
+class StatsResponse(BaseModel):
+    group_by: List[str]
+    groups: List[StatsGroup]
+    source: str = "live"
+    refreshed_at: Optional[datetime] = None
+
+class ChangeEntry(BaseModel):
+    table: str
+    operation: str
+    id: int
+    row: Optional[Dict[str, Any]] = None
+
+class ChangesResponse(BaseModel):
+    changes: List[ChangeEntry]
+    next: str
+    has_more: bool
+
+class AttributeSummary(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    variance: Optional[float] = None
+    stddev: Optional[float] = None
+
+class CuppingSummaryResponse(BaseModel):
+    coffee_id: int
+    attributes: Dict[str, AttributeSummary]
+
+class RollupStatus(BaseModel):
+    name: str
+    group_by: str
+    refreshed_at: Optional[datetime] = None
+    age_seconds: Optional[float] = None
+    duration_ms: Optional[float] = None
@@ -0,0 +1,91 @@
+from sqlalchemy import func, select, text
+from app.config.database import Base
+import app.models.models  # noqa: F401 - registers the tables on Base.metadata
+from app.services.changes import create_change_tracking
+from app.services.cupping_aggregates import backfill_aggregates
+from app.services.rollups import create_rollups
+
+# Transaction advisory lock held while upgrading, so workers starting together
+# upgrade one after the other instead of racing on the same DDL
+SCHEMA_LOCK_KEY = 0x73636865
+
+# Columns added to the models after their table was created, as
+# (table, column, definition). create_all only creates missing tables, so these
+# are added here. ALTER TABLE locks the table even when the column exists, so it
+# is only issued for columns information_schema does not list yet.
+SCHEMA_UPGRADES = [
+    # updated_at on every table, for ETags and change tracking
+    ("countries", "updated_at", "TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')"),
+    ("producers", "updated_at", "TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')"),
+    ("cupping_scores", "updated_at", "TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc')"),
+    # lot_number completes the coffees natural key used by upserts
+    ("coffees", "lot_number", "VARCHAR"),
+    # change_xid for the changes feed
+    ("countries", "change_xid", "BIGINT"),
+    ("producers", "change_xid", "BIGINT"),
+    ("coffees", "change_xid", "BIGINT"),
+    ("cupping_scores", "change_xid", "BIGINT"),
+]
+
+def missing_columns(connection):
+    """
+    The SCHEMA_UPGRADES whose column does not exist yet
+    """
+    existing = set(connection.execute(text(
+        "SELECT table_name, column_name FROM information_schema.columns WHERE table_schema = current_schema()"
+    )).all())
+    return [(table, column, definition) for table, column, definition in SCHEMA_UPGRADES
+            if (table, column) not in existing]
+
+def duplicate_keys(connection, index, limit=10):
+    """
+    Up to limit key values of a unique index that several rows share, with their
+    ids. Rows with a NULL in the key never clash.
+    """
+    id_column = index.table.primary_key.columns[0]
+    keys = list(index.expressions)
+    return connection.execute(
+        select(*keys, func.array_agg(id_column))
+        .where(*[key.is_not(None) for key in keys])
+        .group_by(*keys)
+        .having(func.count() > 1)
+        .limit(limit)
+    ).all()
+
+def check_unique(connection, index):
+    """
+    Fail with the clashing keys when a unique index that does not exist yet cannot
+    be built over the rows already stored
+    """
+    if not index.unique or connection.scalar(text("SELECT to_regclass(:name)"), {"name": index.name}):
+        return
+    clashes = duplicate_keys(connection, index)
+    if clashes:
+        keys = ", ".join(str(key) for key in index.expressions)
+        rows = "; ".join(f"{tuple(clash[:-1])} in rows {sorted(clash[-1])}" for clash in clashes)
+        raise RuntimeError(
+            f"Cannot create unique index {index.name}: rows of {index.table.name} share ({keys}): {rows}. "
+            f"Merge or delete the duplicates (or make their keys distinct) and restart."
+        )
+
+def upgrade_schema(bind):
+    """
+    Bring an existing database up to date with the models: create missing tables,
+    add the missing SCHEMA_UPGRADES columns, create any model index that does not
+    exist yet (failing with the clashing keys when existing rows break a unique
+    one), the materialized rollup views, the change tracking triggers and the
+    cupping aggregates of existing scores. One worker upgrades at a time; the
+    others wait and then find nothing left to do.
+    """
+    with bind.begin() as connection:
+        connection.execute(select(func.pg_advisory_xact_lock(SCHEMA_LOCK_KEY)))
+        Base.metadata.create_all(bind=connection)
+        for table, column, definition in missing_columns(connection):
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                check_unique(connection, index)
+                index.create(connection, checkfirst=True)
+        create_rollups(connection)
+        create_change_tracking(connection)
+        backfill_aggregates(connection)
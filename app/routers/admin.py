@@ -0,0 +1,101 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status
+from sqlalchemy.orm import Session
+from typing import List
+import logging
+from app.config.database import get_db, session_endpoint
+from app.models.models import JobProgress, JobProgressResponse
+from app.routers.singleflight import single_flight
+from app.services import recompute, rollups
+from app.services.batching import batching_stats
+from app.services.cache import response_cache
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+def _run_rollup_refresh():
+    try:
+        rollups.refresh_rollups()
+    except Exception:
+        logger.exception("Rollup refresh failed")
+
+def _run_recompute(chunk_size: int, restart: bool, lock):
+    try:
+        recompute.run_all(chunk_size, restart, recompute.log_progress, lock)
+    except Exception:
+        logger.exception("Score recompute failed")
+
+@router.post("/recompute-scores", status_code=status.HTTP_202_ACCEPTED)
+def start_recompute_scores(
+    background_tasks: BackgroundTasks,
+    chunk_size: int = recompute.DEFAULT_CHUNK_SIZE,
+    restart: bool = False
+):
+    """
+    Start recomputing total_cup_points, quality_classification and total_score
+    in the background. An interrupted run resumes unless restart is set.
+    """
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    lock = recompute.acquire_recompute_lock()
+    if lock is None:
+        raise HTTPException(status_code=409, detail="Score recompute already running")
+    
+    background_tasks.add_task(_run_recompute, chunk_size, restart, lock)
+    return {"status": "started", "jobs": list(recompute.JOBS)}
+
+@router.get("/recompute-scores", response_model=List[JobProgressResponse])
+@session_endpoint
+def read_recompute_scores(db: Session = Depends(get_db)):
+    """
+    Get the progress of the score recompute jobs
+    """
+    return db.query(JobProgress).filter(JobProgress.job_name.in_(list(recompute.JOBS))).all()
+
+@router.get("/jobs/{job_name}", response_model=JobProgressResponse)
+@session_endpoint
+def read_job(job_name: str, db: Session = Depends(get_db)):
+    """
+    Get the progress of a background job, such as a batched delete
+    """
+    job = db.get(JobProgress, job_name)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/rollups/refresh", status_code=status.HTTP_202_ACCEPTED)
+def start_rollup_refresh(background_tasks: BackgroundTasks):
+    """
+    Refresh the materialized stats rollups in the background
+    """
+    background_tasks.add_task(_run_rollup_refresh)
+    return {"status": "started", "rollups": [rollup.name for rollup in rollups.ROLLUPS]}
+
+@router.get("/cache")
+def read_cache_stats():
+    """
+    Get response cache size and hit/miss ratios
+    """
+    return response_cache.stats()
+
+@router.get("/batching")
+def read_batching_stats():
+    """
+    Get how many single-row lookups each table's batcher served and in how many queries
+    """
+    return batching_stats()
+
+@router.get("/single-flight")
+def read_single_flight_stats():
+    """
+    Get how many read requests ran and how many shared an identical request's
+    execution instead
+    """
+    return single_flight.stats()
+
+@router.get("/streams")
+def read_stream_stats(request: Request):
+    """
+    Get the number of streaming clients, the last event id and how many clients
+    were disconnected for falling behind
+    """
+    return request.app.state.change_stream.stats()
@@ -1,84 +1,418 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import delete, func, insert, literal, literal_column, select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.config.database import get_db
+from typing import List, Optional, Union
+from app.config.database import get_db, session_endpoint, DB_ASYNC
+from app.routers.batch import check_ids, parse_ids, with_ids, in_order, select_by_ids
+from app.routers.conditional import conditional, row_etag, page_etag
+from app.routers.expand import (
+    parse_expand, loader_options, expanded_response, COFFEE_EXPANSIONS, PRODUCER_EXPANSIONS
+)
+from app.routers.pagination import (
+    MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, paginate, paginate_versioned_rows, paginate_latest, newest_first
+)
+from app.routers.singleflight import SingleFlightRoute
+from app.routers.rows import (
+    parse_fields, load_fields, select_rows, rows_response, row_response
+)
+from app.services.cache import cached
+from app.services import purge
+from app.services.batching import load_row
+from app.services.cupping_aggregates import (
+    AGGREGATE_FIELDS, add_observations, remove_observations, update_observations, cupping_summary
+)
+from app.services.events import record_change
+from app.services.export import (
+    EXPORT_INCLUDES, MEDIA_TYPES, coffee_export_query, stream_export, stream_export_async
+)
+from app.services.scoring import (
+    COFFEE_SCORE_FIELDS, CUPPING_SCORE_FIELDS,
+    score_coffee, score_cupping, score_coffee_batch, score_cupping_batch, columns_from_rows, to_optional_list,
+    coffee_total_sql, cupping_total_sql, classify_sql
+)
 from app.models.models import (
     Country, Producer, Coffee, CuppingScore,
-    CountryCreate, CountryUpdate, CountryResponse,
+    CountryCreate, CountryUpdate, CountryUpsert, CountryResponse,
     ProducerCreate, ProducerUpdate, ProducerResponse,
     CoffeeCreate, CoffeeUpdate, CoffeeResponse,
-    CuppingScoreCreate, CuppingScoreUpdate, CuppingScoreResponse
+    BulkCoffeeRowResult, BulkCoffeeResponse, BulkUpsertRowResult, BulkUpsertResponse, BatchGetRequest,
+    CuppingScoreCreate, CuppingScoreUpdate, CuppingScoreResponse, CuppingSummaryResponse,
+    CuppingSessionCreate, CuppingSessionResponse
 )
 from datetime import datetime
+from types import SimpleNamespace
+import logging
+import time
+
+# Identical concurrent reads share one execution
+router = APIRouter(route_class=SingleFlightRoute)
+logger = logging.getLogger(__name__)
+
+def _run_purge(table, row_id, batch_size):
+    try:
+        purge.run_purge(table, row_id, batch_size, purge.log_progress)
+    except Exception:
+        logger.exception("Background delete of %s %s failed", table, row_id)
+
+def _start_purge(background_tasks, db, table, row_id, batch_size):
+    """
+    Start deleting a row and its descendants in batches, answering 202 with the job
+    """
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be positive")
+    id_column = purge.ROOTS[table][1]
+    if db.scalar(select(id_column).where(id_column == row_id)) is None:
+        raise HTTPException(status_code=404, detail=f"{purge.ROOTS[table][0].__name__} not found")
+    if not purge.claim(table, row_id):
+        raise HTTPException(status_code=409, detail="Delete already running")
+    
+    background_tasks.add_task(_run_purge, table, row_id, batch_size)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"status": "started", "job": purge.job_name(table, row_id)}
+    )
+
+def _assigned(entity, values):
+    """
+    entity's columns as they will be after an UPDATE setting values, so derived
+    columns can be computed by expressions inside the same UPDATE
+    """
+    return SimpleNamespace(**{
+        column.key: literal(values[column.key], column.type) if column.key in values else column
+        for column in entity.__table__.columns
+    })
+
+# SQLSTATEs of the integrity errors answered as client errors
+FOREIGN_KEY_VIOLATION = "23503"
+UNIQUE_VIOLATION = "23505"
+
+def _sqlstate(error):
+    return getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+
+def _flush_new(db, entity):
+    """
+    Flush a pending insert, answering a unique key (natural key) clash with a 400
+    """
+    try:
+        db.flush()
+    except IntegrityError as error:
+        if _sqlstate(error) != UNIQUE_VIOLATION:
+            raise
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"{entity.__name__} already exists")
+
+def _update_returning(db, entity, row_id, values, parent=None, previous=()):
+    """
+    Update one row by primary key with a single UPDATE ... RETURNING and return it as
+    a mapping, or None if it does not exist. Columns named in previous are returned
+    as they were before the update too, as previous_<name>. A foreign key violation
+    means the parent does not exist and is answered with a 404, a unique key clash
+    with another row with a 400.
+    """
+    table = entity.__table__
+    id_column = table.primary_key.columns[0]
+    if not values:
+        statement = select(table).where(id_column == row_id)
+    elif previous:
+        old = select(table).where(id_column == row_id).with_for_update().subquery("previous")
+        statement = (
+            update(table).where(id_column == old.c[id_column.key]).values(**values)
+            .returning(*table.columns, *[old.c[name].label(f"previous_{name}") for name in previous])
+        )
+    else:
+        statement = update(table).where(id_column == row_id).values(**values).returning(*table.columns)
+    
+    try:
+        return db.execute(statement).mappings().first()
+    except IntegrityError as error:
+        code = _sqlstate(error)
+        if parent and code == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(status_code=404, detail=f"{parent} not found")
+        if code == UNIQUE_VIOLATION:
+            raise HTTPException(status_code=400, detail=f"{entity.__name__} already exists")
+        raise
+
+# RETURNING column telling a row inserted by INSERT ... ON CONFLICT DO UPDATE from one it updated
+INSERTED = literal_column("xmax = 0").label("inserted")
+
+def _producer_key(row):
+    return (row["company_name"], row["farm_name"] or "", row["country_id"])
 
-router = APIRouter()
+def _coffee_key(row):
+    key = (row["producer_id"], row["harvest_year"], row["lot_number"])
+    return None if None in key else key
+
+def _upsert(db, entity, rows, key_of, key_names):
+    """
+    Insert rows, updating the row with the same natural key (entity.natural_key)
+    where one exists, with INSERT ... ON CONFLICT DO UPDATE. Rows repeating a key
+    collapse into the last of them; rows key_of maps to None are plain inserts.
+    Returns (id, inserted) for every row.
+    """
+    table = entity.__table__
+    id_column = table.primary_key.columns[0]
+    keyed, plain = {}, []
+    for index, row in enumerate(rows):
+        key = key_of(row)
+        if key is None:
+            plain.append(index)
+        else:
+            keyed.setdefault(key, []).append(index)
+    
+    results = [None] * len(rows)
+    if keyed:
+        statement = postgresql.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(entity.natural_key),
+            set_={name: statement.excluded[name] for name in rows[0] if name != "created_at"}
+        ).returning(id_column, INSERTED, *[table.c[name] for name in key_names])
+        for returned in db.execute(statement, [rows[indexes[-1]] for indexes in keyed.values()]).mappings():
+            indexes = keyed[key_of(returned)]
+            for index in indexes:
+                results[index] = (returned[id_column.key], returned["inserted"] and index == indexes[-1])
+    if plain:
+        ids = db.scalars(
+            insert(table).returning(id_column, sort_by_parameter_order=True), [rows[index] for index in plain]
+        ).all()
+        for index, row_id in zip(plain, ids):
+            results[index] = (row_id, True)
+    return results
+
+def _insert_new(db, entity, rows, key_of, key_names):
+    """
+    Insert rows with INSERT ... ON CONFLICT DO NOTHING on the natural key
+    (entity.natural_key). Returns the new id of every row, or None for rows whose
+    key exists already or repeats an earlier row's; rows key_of maps to None are
+    plain inserts.
+    """
+    table = entity.__table__
+    id_column = table.primary_key.columns[0]
+    keyed, plain = {}, []
+    for index, row in enumerate(rows):
+        key = key_of(row)
+        if key is None:
+            plain.append(index)
+        elif key not in keyed:
+            keyed[key] = index
+    
+    results = [None] * len(rows)
+    if keyed:
+        statement = postgresql.insert(table).on_conflict_do_nothing(
+            index_elements=list(entity.natural_key)
+        ).returning(id_column, *[table.c[name] for name in key_names])
+        for returned in db.execute(statement, [rows[index] for index in keyed.values()]).mappings():
+            results[keyed[key_of(returned)]] = returned[id_column.key]
+    if plain:
+        ids = db.scalars(
+            insert(table).returning(id_column, sort_by_parameter_order=True), [rows[index] for index in plain]
+        ).all()
+        for index, row_id in zip(plain, ids):
+            results[index] = row_id
+    return results
+
+def _upsert_response(db, table, accepted, upserted, rejected):
+    """
+    Record the change, commit and build the BulkUpsertResponse of a bulk upsert
+    """
+    results = [BulkUpsertRowResult(index=index, status="rejected", error=error) for index, error in rejected]
+    for index, (row_id, inserted) in zip(accepted, upserted):
+        results.append(BulkUpsertRowResult(index=index, status="inserted" if inserted else "updated", id=row_id))
+    results.sort(key=lambda result: result.index)
+    if upserted:
+        record_change(db, table, "update")
+        db.commit()
+    inserted = sum(1 for _, was_inserted in upserted if was_inserted)
+    return BulkUpsertResponse(
+        inserted=inserted, updated=len(upserted) - inserted, rejected=len(rejected), results=results
+    )
+
+def _read_by_ids(db, response, entity, model, query, ids, columns=(), expansions=None):
+    """
+    The rows of a list query (ORM query with expansions, else Core select) with the
+    given ids, in the order asked for, from one id = ANY(...) query. Ids without a
+    row are left out.
+    """
+    id_column = entity.__table__.primary_key.columns[0]
+    if expansions:
+        rows = (
+            query.options(*loader_options(entity, expansions), *load_fields(entity, columns, id_column))
+            .filter(with_ids(id_column, ids))
+            .all()
+        )
+        rows = in_order(rows, ids, lambda row: getattr(row, id_column.key))
+        return expanded_response(entity, expansions, rows, response, many=True, fields=columns)
+    return rows_response(model, select_by_ids(db, query, id_column, ids), response, columns)
+
+MAX_BULK_ROWS = 10000
 
 # Country endpoints
 @router.post("/countries/", response_model=CountryResponse, status_code=status.HTTP_201_CREATED)
+@session_endpoint
 def create_country(country: CountryCreate, db: Session = Depends(get_db)):
     """
-    Create a new country entry
+    Create a new country entry; the unique country_name decides whether it exists
     """
-    db_country = db.query(Country).filter(Country.country_name == country.country_name).first()
-    if db_country:
+    new_country = db.execute(
+        postgresql.insert(Country).values(**country.dict())
+        .on_conflict_do_nothing(index_elements=[Country.country_name])
+        .returning(*Country.__table__.columns)
+    ).mappings().first()
+    if new_country is None:
         raise HTTPException(status_code=400, detail="Country already exists")
     
-    new_country = Country(**country.dict())
-    db.add(new_country)
+    record_change(db, "countries", "insert", new_country["country_id"])
     db.commit()
-    db.refresh(new_country)
     return new_country
 
+@router.put("/countries/by-name/{country_name}", response_model=CountryResponse)
+@session_endpoint
+def upsert_country(country_name: str, country: CountryUpsert, response: Response, db: Session = Depends(get_db)):
+    """
+    Create the country named country_name, or update the given fields if it exists,
+    with one INSERT ... ON CONFLICT DO UPDATE. Answers 201 when it was created.
+    """
+    values = country.dict(exclude_unset=True)
+    statement = postgresql.insert(Country).values(country_name=country_name, updated_at=datetime.utcnow(), **values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Country.country_name],
+        set_={name: statement.excluded[name] for name in ("updated_at", *values)}
+    )
+    db_country = db.execute(statement.returning(*Country.__table__.columns, INSERTED)).mappings().one()
+    
+    if db_country["inserted"]:
+        response.status_code = status.HTTP_201_CREATED
+    record_change(db, "countries", "insert" if db_country["inserted"] else "update", db_country["country_id"])
+    db.commit()
+    return db_country
+
 @router.get("/countries/", response_model=List[CountryResponse])
-def read_countries(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@cached("countries", List[CountryResponse])
+@session_endpoint
+def read_countries(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ids: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get a list of countries with pagination
+    Get a list of countries with cursor or offset pagination.
+    ids=1,2,3 returns those countries instead, in that order, without paging;
+    fields=a,b limits the response (and the SELECT) to those fields.
     """
-    countries = db.query(Country).offset(skip).limit(limit).all()
-    return countries
+    columns = parse_fields(fields, CountryResponse)
+    query = select_rows(Country, CountryResponse, columns)
+    if ids is not None:
+        return _read_by_ids(db, response, Country, CountryResponse, query, parse_ids(ids), columns)
+    countries, versions = paginate_versioned_rows(
+        db, query, response, Country.country_id, Country.updated_at,
+        {"country_id": Country.country_id},
+        cursor=cursor, skip=skip, limit=limit
+    )
+    etag = page_etag("countries", versions, response.headers.get(NEXT_CURSOR_HEADER), request.url.query)
+    unchanged = conditional(request, response, etag)
+    if unchanged:
+        return unchanged
+    return rows_response(CountryResponse, countries, response, columns)
+
+@router.post("/countries/batch-get", response_model=List[CountryResponse])
+@session_endpoint
+def batch_get_countries(
+    batch: BatchGetRequest,
+    response: Response,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get the countries with the given ids, in that order; missing ids are left out
+    """
+    columns = parse_fields(fields, CountryResponse)
+    query = select_rows(Country, CountryResponse, columns)
+    return _read_by_ids(db, response, Country, CountryResponse, query, check_ids(batch.ids), columns)
 
 @router.get("/countries/{country_id}", response_model=CountryResponse)
-def read_country(country_id: int, db: Session = Depends(get_db)):
+@cached("countries", CountryResponse, id_param="country_id")
+@session_endpoint
+def read_country(
+    country_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get a specific country by ID
+    Get a specific country by ID, optionally limited to some fields
     """
-    db_country = db.query(Country).filter(Country.country_id == country_id).first()
+    columns = parse_fields(fields, CountryResponse)
+    if DB_ASYNC and not columns:
+        # Concurrent lookups of single countries share one query
+        db_country = load_row("countries", country_id)
+    else:
+        db_country = (
+            db.query(Country)
+            .options(*load_fields(Country, columns, Country.updated_at))
+            .filter(Country.country_id == country_id)
+            .first()
+        )
     if db_country is None:
         raise HTTPException(status_code=404, detail="Country not found")
+    
+    unchanged = conditional(request, response, row_etag("countries", country_id, db_country.updated_at, *columns))
+    if unchanged:
+        return unchanged
+    if columns:
+        return row_response(CountryResponse, columns, db_country, response)
     return db_country
 
 @router.put("/countries/{country_id}", response_model=CountryResponse)
+@router.patch("/countries/{country_id}", response_model=CountryResponse)
+@session_endpoint
 def update_country(country_id: int, country: CountryUpdate, db: Session = Depends(get_db)):
     """
-    Update a country entry
+    Update the given fields of a country entry with one UPDATE ... RETURNING
     """
-    db_country = db.query(Country).filter(Country.country_id == country_id).first()
+    db_country = _update_returning(db, Country, country_id, country.dict(exclude_unset=True))
     if db_country is None:
         raise HTTPException(status_code=404, detail="Country not found")
     
-    update_data = country.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_country, key, value)
-    
+    record_change(db, "countries", "update", country_id)
     db.commit()
-    db.refresh(db_country)
     return db_country
 
 @router.delete("/countries/{country_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_country(country_id: int, db: Session = Depends(get_db)):
+@session_endpoint
+def delete_country(
+    country_id: int,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    batch_size: int = purge.DEFAULT_BATCH_SIZE,
+    db: Session = Depends(get_db)
+):
     """
-    Delete a country entry and all related data
+    Delete a country entry and all related data with one DELETE; the foreign keys
+    cascade it in the database. background=true deletes it in batches of batch_size
+    rows instead and answers 202 with a job followed at /api/admin/jobs/{job_name}.
     """
-    db_country = db.query(Country).filter(Country.country_id == country_id).first()
-    if db_country is None:
+    if background:
+        return _start_purge(background_tasks, db, "countries", country_id, batch_size)
+    
+    deleted = db.execute(delete(Country).where(Country.country_id == country_id).returning(Country.country_id)).scalar()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Country not found")
     
-    db.delete(db_country)
+    record_change(db, "countries", "delete", country_id)
     db.commit()
     return None
 
 # Producer endpoints
 @router.post("/producers/", response_model=ProducerResponse, status_code=status.HTTP_201_CREATED)
+@session_endpoint
 def create_producer(producer: ProducerCreate, db: Session = Depends(get_db)):
     """
     Create a new producer entry
@@ -89,68 +423,197 @@ def create_producer(producer: ProducerCreate, db: Session = Depends(get_db)):
     
     new_producer = Producer(**producer.dict())
     db.add(new_producer)
+    _flush_new(db, Producer)
+    record_change(db, "producers", "insert", new_producer.producer_id)
     db.commit()
     db.refresh(new_producer)
     return new_producer
 
+@router.put("/producers/bulk", response_model=BulkUpsertResponse)
+@session_endpoint
+def upsert_producers_bulk(producers: List[ProducerCreate], atomic: bool = True, db: Session = Depends(get_db)):
+    """
+    Insert or update many producers in one transaction, matched on company_name,
+    farm_name and country_id, so re-running an import does not duplicate them.
+    atomic works as for POST /coffees/bulk.
+    """
+    if len(producers) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} producers per request")
+    
+    now = datetime.utcnow()
+    rows = [dict(producer.dict(), created_at=now, updated_at=now) for producer in producers]
+    country_ids = {row["country_id"] for row in rows}
+    known_countries = set(
+        db.scalars(select(Country.country_id).where(Country.country_id.in_(country_ids))).all()
+    ) if country_ids else set()
+    
+    accepted = [index for index, row in enumerate(rows) if row["country_id"] in known_countries]
+    rejected = [(index, "Country not found") for index, row in enumerate(rows) if row["country_id"] not in known_countries]
+    if atomic and rejected:
+        raise HTTPException(
+            status_code=422,
+            detail=[{"index": index, "status": "rejected", "error": error} for index, error in rejected]
+        )
+    
+    upserted = _upsert(
+        db, Producer, [rows[index] for index in accepted], _producer_key, ("company_name", "farm_name", "country_id")
+    ) if accepted else []
+    return _upsert_response(db, "producers", accepted, upserted, rejected)
+
 @router.get("/producers/", response_model=List[ProducerResponse])
-def read_producers(skip: int = 0, limit: int = 100, country_id: Optional[int] = None, db: Session = Depends(get_db)):
+@cached("producers", List[ProducerResponse])
+@session_endpoint
+def read_producers(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    country_id: Optional[int] = None,
+    ids: Optional[str] = None,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get a list of producers with optional country_id filter and pagination
+    Get a list of producers with optional country_id filter, sorting and pagination.
+    ids=1,2,3 returns those producers instead, in that order, without paging;
+    expand=country,coffees,coffees.cupping_scores nests the related rows;
+    fields=a,b limits the response (and the SELECT) to those fields.
     """
-    query = db.query(Producer)
+    expansions = parse_expand(expand, PRODUCER_EXPANSIONS)
+    columns = parse_fields(fields, ProducerResponse)
+    sortable = {"producer_id": Producer.producer_id, "created_at": Producer.created_at}
+    query = db.query(Producer) if expansions else select_rows(Producer, ProducerResponse, columns)
     if country_id:
         query = query.filter(Producer.country_id == country_id)
-    producers = query.offset(skip).limit(limit).all()
-    return producers
+    if ids is not None:
+        return _read_by_ids(db, response, Producer, ProducerResponse, query, parse_ids(ids), columns, expansions)
+    
+    if expansions:
+        query = query.options(
+            *loader_options(Producer, expansions), *load_fields(Producer, columns, *sortable.values())
+        )
+        producers = paginate(
+            query, response, Producer.producer_id,
+            sortable, sort=sort, cursor=cursor, skip=skip, limit=limit
+        )
+        return expanded_response(Producer, expansions, producers, response, many=True, fields=columns)
+    
+    producers, versions = paginate_versioned_rows(
+        db, query, response, Producer.producer_id, Producer.updated_at,
+        sortable, sort=sort, cursor=cursor, skip=skip, limit=limit
+    )
+    etag = page_etag("producers", versions, response.headers.get(NEXT_CURSOR_HEADER), request.url.query)
+    unchanged = conditional(request, response, etag)
+    if unchanged:
+        return unchanged
+    return rows_response(ProducerResponse, producers, response, columns)
+
+@router.post("/producers/batch-get", response_model=List[ProducerResponse])
+@session_endpoint
+def batch_get_producers(
+    batch: BatchGetRequest,
+    response: Response,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get the producers with the given ids, in that order; missing ids are left out
+    """
+    expansions = parse_expand(expand, PRODUCER_EXPANSIONS)
+    columns = parse_fields(fields, ProducerResponse)
+    query = db.query(Producer) if expansions else select_rows(Producer, ProducerResponse, columns)
+    return _read_by_ids(db, response, Producer, ProducerResponse, query, check_ids(batch.ids), columns, expansions)
 
 @router.get("/producers/{producer_id}", response_model=ProducerResponse)
-def read_producer(producer_id: int, db: Session = Depends(get_db)):
+@cached("producers", ProducerResponse, id_param="producer_id")
+@session_endpoint
+def read_producer(
+    producer_id: int,
+    request: Request,
+    response: Response,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get a specific producer by ID
+    Get a specific producer by ID, optionally with expanded related rows or limited
+    to some fields
     """
-    db_producer = db.query(Producer).filter(Producer.producer_id == producer_id).first()
+    expansions = parse_expand(expand, PRODUCER_EXPANSIONS)
+    columns = parse_fields(fields, ProducerResponse)
+    if DB_ASYNC and not columns and not expansions:
+        # Concurrent lookups of single producers share one query
+        db_producer = load_row("producers", producer_id)
+    else:
+        db_producer = (
+            db.query(Producer)
+            .options(
+                *loader_options(Producer, expansions),
+                *load_fields(Producer, columns, Producer.updated_at, Producer.country_id)
+            )
+            .filter(Producer.producer_id == producer_id)
+            .first()
+        )
     if db_producer is None:
         raise HTTPException(status_code=404, detail="Producer not found")
+    
+    if expansions:
+        return expanded_response(Producer, expansions, db_producer, response, fields=columns)
+    unchanged = conditional(request, response, row_etag("producers", producer_id, db_producer.updated_at, *columns))
+    if unchanged:
+        return unchanged
+    if columns:
+        return row_response(ProducerResponse, columns, db_producer, response)
     return db_producer
 
 @router.put("/producers/{producer_id}", response_model=ProducerResponse)
+@router.patch("/producers/{producer_id}", response_model=ProducerResponse)
+@session_endpoint
 def update_producer(producer_id: int, producer: ProducerUpdate, db: Session = Depends(get_db)):
     """
-    Update a producer entry
+    Update the given fields of a producer entry with one UPDATE ... RETURNING;
+    the foreign key checks country_id
     """
-    db_producer = db.query(Producer).filter(Producer.producer_id == producer_id).first()
+    db_producer = _update_returning(db, Producer, producer_id, producer.dict(exclude_unset=True), "Country")
     if db_producer is None:
         raise HTTPException(status_code=404, detail="Producer not found")
     
-    update_data = producer.dict(exclude_unset=True)
-    if "country_id" in update_data:
-        db_country = db.query(Country).filter(Country.country_id == update_data["country_id"]).first()
-        if db_country is None:
-            raise HTTPException(status_code=404, detail="Country not found")
-    
-    for key, value in update_data.items():
-        setattr(db_producer, key, value)
-    
+    record_change(db, "producers", "update", producer_id)
     db.commit()
-    db.refresh(db_producer)
     return db_producer
 
 @router.delete("/producers/{producer_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_producer(producer_id: int, db: Session = Depends(get_db)):
+@session_endpoint
+def delete_producer(
+    producer_id: int,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    batch_size: int = purge.DEFAULT_BATCH_SIZE,
+    db: Session = Depends(get_db)
+):
     """
-    Delete a producer entry and all related data
+    Delete a producer entry and all related data with one DELETE; the foreign keys
+    cascade it in the database. background=true deletes it in batches of batch_size
+    rows instead and answers 202 with a job followed at /api/admin/jobs/{job_name}.
     """
-    db_producer = db.query(Producer).filter(Producer.producer_id == producer_id).first()
-    if db_producer is None:
+    if background:
+        return _start_purge(background_tasks, db, "producers", producer_id, batch_size)
+    
+    deleted = db.execute(delete(Producer).where(Producer.producer_id == producer_id).returning(Producer.producer_id)).scalar()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Producer not found")
     
-    db.delete(db_producer)
+    record_change(db, "producers", "delete", producer_id)
     db.commit()
     return None
 
 # Coffee endpoints
 @router.post("/coffees/", response_model=CoffeeResponse, status_code=status.HTTP_201_CREATED)
+@session_endpoint
 def create_coffee(coffee: CoffeeCreate, db: Session = Depends(get_db)):
     """
     Create a new coffee entry
@@ -162,47 +625,173 @@ def create_coffee(coffee: CoffeeCreate, db: Session = Depends(get_db)):
     new_coffee = Coffee(**coffee.dict())
     
     # Calculate total cup points if all score fields are provided
-    score_fields = ['aroma', 'flavor', 'aftertaste', 'acidity', 'body', 'balance', 'uniformity', 'clean_cup', 'sweetness']
-    if all(getattr(new_coffee, field) is not None for field in score_fields):
-        total_points = (
-            new_coffee.aroma + 
-            new_coffee.flavor + 
-            new_coffee.aftertaste + 
-            new_coffee.acidity + 
-            new_coffee.body + 
-            new_coffee.balance + 
-            new_coffee.uniformity + 
-            new_coffee.clean_cup + 
-            new_coffee.sweetness
-        )
-        
+    total_points, classification = score_coffee(new_coffee)
+    if total_points is not None:
         new_coffee.total_cup_points = total_points
-        
-        if total_points >= 80:
-            new_coffee.quality_classification = "Specialty"
-        elif total_points >= 70:
-            new_coffee.quality_classification = "Premium"
-        else:
-            new_coffee.quality_classification = "Standard"
+        new_coffee.quality_classification = classification
     
     db.add(new_coffee)
+    _flush_new(db, Coffee)
+    record_change(db, "coffees", "insert", new_coffee.coffee_id)
     db.commit()
     db.refresh(new_coffee)
     return new_coffee
 
+@router.post("/coffees/bulk", response_model=BulkCoffeeResponse, status_code=status.HTTP_201_CREATED)
+@session_endpoint
+def create_coffees_bulk(
+    coffees: List[CoffeeCreate],
+    response: Response,
+    atomic: bool = True,
+    db: Session = Depends(get_db)
+):
+    """
+    Create many coffee entries in one transaction.
+
+    With atomic=true (the default) nothing is inserted unless every row is valid;
+    with atomic=false valid rows are inserted and invalid ones are reported as rejected.
+    A row whose producer_id, harvest_year and lot_number match an existing coffee or
+    an earlier row is invalid.
+    """
+    if len(coffees) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} coffees per request")
+    
+    start = time.perf_counter()
+    rows = [coffee.dict() for coffee in coffees]
+    
+    producer_ids = {row["producer_id"] for row in rows}
+    known_producers = set(
+        db.scalars(select(Producer.producer_id).where(Producer.producer_id.in_(producer_ids))).all()
+    ) if producer_ids else set()
+    
+    results = [BulkCoffeeRowResult(index=index, status="created") for index in range(len(rows))]
+    accepted = []
+    for index, row in enumerate(rows):
+        if row["producer_id"] in known_producers:
+            accepted.append(index)
+        else:
+            results[index].status = "rejected"
+            results[index].error = "Producer not found"
+    
+    rejected = len(rows) - len(accepted)
+    if atomic and rejected:
+        raise HTTPException(
+            status_code=422,
+            detail=[result.dict(exclude_none=True) for result in results if result.status == "rejected"]
+        )
+    
+    if accepted:
+        accepted_rows = [rows[index] for index in accepted]
+        totals, classifications = score_coffee_batch(columns_from_rows(accepted_rows, COFFEE_SCORE_FIELDS))
+        now = datetime.utcnow()
+        for row, total_points, classification in zip(
+            accepted_rows, to_optional_list(totals), to_optional_list(classifications)
+        ):
+            row["total_cup_points"] = total_points
+            row["quality_classification"] = classification
+            row["created_at"] = now
+            row["updated_at"] = now
+        
+        coffee_ids = _insert_new(
+            db, Coffee, accepted_rows, _coffee_key, ("producer_id", "harvest_year", "lot_number")
+        )
+        for index, coffee_id in zip(accepted, coffee_ids):
+            if coffee_id is None:
+                results[index].status = "rejected"
+                results[index].error = "Coffee already exists"
+            else:
+                results[index].coffee_id = coffee_id
+        
+        duplicates = coffee_ids.count(None)
+        if atomic and duplicates:
+            db.rollback()
+            raise HTTPException(
+                status_code=422,
+                detail=[result.dict(exclude_none=True) for result in results if result.status == "rejected"]
+            )
+        rejected += duplicates
+        if duplicates < len(coffee_ids):
+            record_change(db, "coffees", "insert")
+            db.commit()
+    
+    elapsed = time.perf_counter() - start
+    response.headers["X-Rows-Per-Second"] = f"{len(rows) / elapsed:.1f}" if elapsed else "0"
+    response.headers["X-Elapsed-Ms"] = f"{elapsed * 1000:.1f}"
+    return BulkCoffeeResponse(created=len(rows) - rejected, rejected=rejected, results=results)
+
+@router.put("/coffees/bulk", response_model=BulkUpsertResponse)
+@session_endpoint
+def upsert_coffees_bulk(coffees: List[CoffeeCreate], atomic: bool = True, db: Session = Depends(get_db)):
+    """
+    Insert or update many coffees in one transaction, matched on producer_id,
+    harvest_year and lot_number, so re-running an import does not duplicate them.
+    Coffees missing any of the three are always inserted. atomic works as for
+    POST /coffees/bulk.
+    """
+    if len(coffees) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} coffees per request")
+    
+    rows = [coffee.dict() for coffee in coffees]
+    producer_ids = {row["producer_id"] for row in rows}
+    known_producers = set(
+        db.scalars(select(Producer.producer_id).where(Producer.producer_id.in_(producer_ids))).all()
+    ) if producer_ids else set()
+    
+    accepted = [index for index, row in enumerate(rows) if row["producer_id"] in known_producers]
+    rejected = [(index, "Producer not found") for index, row in enumerate(rows) if row["producer_id"] not in known_producers]
+    if atomic and rejected:
+        raise HTTPException(
+            status_code=422,
+            detail=[{"index": index, "status": "rejected", "error": error} for index, error in rejected]
+        )
+    
+    accepted_rows = [rows[index] for index in accepted]
+    upserted = []
+    if accepted_rows:
+        totals, classifications = score_coffee_batch(columns_from_rows(accepted_rows, COFFEE_SCORE_FIELDS))
+        now = datetime.utcnow()
+        for row, total_points, classification in zip(
+            accepted_rows, to_optional_list(totals), to_optional_list(classifications)
+        ):
+            row["total_cup_points"] = total_points
+            row["quality_classification"] = classification
+            row["created_at"] = now
+            row["updated_at"] = now
+        upserted = _upsert(db, Coffee, accepted_rows, _coffee_key, ("producer_id", "harvest_year", "lot_number"))
+    return _upsert_response(db, "coffees", accepted, upserted, rejected)
+
 @router.get("/coffees/", response_model=List[CoffeeResponse])
+@cached("coffees", List[CoffeeResponse])
+@session_endpoint
 def read_coffees(
+    request: Request,
+    response: Response,
     skip: int = 0, 
-    limit: int = 100, 
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
     producer_id: Optional[int] = None,
     min_score: Optional[float] = None,
     quality_classification: Optional[str] = None,
+    ids: Optional[str] = None,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
-    Get a list of coffees with optional filters and pagination
+    Get a list of coffees with optional filters, sorting and pagination.
+    ids=1,2,3 returns those coffees instead, in that order, without paging;
+    expand=producer,producer.country,cupping_scores nests the related rows;
+    fields=a,b limits the response (and the SELECT) to those fields.
     """
-    query = db.query(Coffee)
+    expansions = parse_expand(expand, COFFEE_EXPANSIONS)
+    columns = parse_fields(fields, CoffeeResponse)
+    sortable = {
+        "coffee_id": Coffee.coffee_id,
+        "total_cup_points": Coffee.total_cup_points,
+        "created_at": Coffee.created_at,
+    }
+    query = db.query(Coffee) if expansions else select_rows(Coffee, CoffeeResponse, columns)
     
     if producer_id:
         query = query.filter(Coffee.producer_id == producer_id)
@@ -213,80 +802,170 @@ def read_coffees(
     if quality_classification:
         query = query.filter(Coffee.quality_classification == quality_classification)
     
-    coffees = query.offset(skip).limit(limit).all()
-    return coffees
+    if ids is not None:
+        return _read_by_ids(db, response, Coffee, CoffeeResponse, query, parse_ids(ids), columns, expansions)
+    
+    if expansions:
+        query = query.options(
+            *loader_options(Coffee, expansions), *load_fields(Coffee, columns, *sortable.values())
+        )
+        coffees = paginate(
+            query, response, Coffee.coffee_id,
+            sortable, sort=sort, cursor=cursor, skip=skip, limit=limit
+        )
+        return expanded_response(Coffee, expansions, coffees, response, many=True, fields=columns)
+    
+    coffees, versions = paginate_versioned_rows(
+        db, query, response, Coffee.coffee_id, Coffee.updated_at,
+        sortable, sort=sort, cursor=cursor, skip=skip, limit=limit
+    )
+    etag = page_etag("coffees", versions, response.headers.get(NEXT_CURSOR_HEADER), request.url.query)
+    unchanged = conditional(request, response, etag)
+    if unchanged:
+        return unchanged
+    return rows_response(CoffeeResponse, coffees, response, columns)
+
+@router.post("/coffees/batch-get", response_model=List[CoffeeResponse])
+@session_endpoint
+def batch_get_coffees(
+    batch: BatchGetRequest,
+    response: Response,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get the coffees with the given ids, in that order; missing ids are left out
+    """
+    expansions = parse_expand(expand, COFFEE_EXPANSIONS)
+    columns = parse_fields(fields, CoffeeResponse)
+    query = db.query(Coffee) if expansions else select_rows(Coffee, CoffeeResponse, columns)
+    return _read_by_ids(db, response, Coffee, CoffeeResponse, query, check_ids(batch.ids), columns, expansions)
+
+@router.get("/coffees/export")
+def export_coffees(
+    format: str = "ndjson",
+    include: Optional[str] = None,
+    producer_id: Optional[int] = None,
+    min_score: Optional[float] = None,
+    quality_classification: Optional[str] = None
+):
+    """
+    Stream every matching coffee as NDJSON or CSV from a server-side cursor.
+    include=producer,country adds the joined producer_* and country_* columns.
+    """
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Invalid format, expected one of: {', '.join(MEDIA_TYPES)}")
+    
+    includes = [name.strip() for name in include.split(",") if name.strip()] if include else []
+    unknown = set(includes) - set(EXPORT_INCLUDES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid include: {', '.join(sorted(unknown))}")
+    
+    query = coffee_export_query(includes, producer_id, min_score, quality_classification)
+    body = stream_export_async(query, format) if DB_ASYNC else stream_export(query, format)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="coffees.{format}"'}
+    )
 
 @router.get("/coffees/{coffee_id}", response_model=CoffeeResponse)
-def read_coffee(coffee_id: int, db: Session = Depends(get_db)):
+@cached("coffees", CoffeeResponse, id_param="coffee_id")
+@session_endpoint
+def read_coffee(
+    coffee_id: int,
+    request: Request,
+    response: Response,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get a specific coffee by ID
+    Get a specific coffee by ID, optionally with expanded related rows or limited
+    to some fields
     """
-    db_coffee = db.query(Coffee).filter(Coffee.coffee_id == coffee_id).first()
+    expansions = parse_expand(expand, COFFEE_EXPANSIONS)
+    columns = parse_fields(fields, CoffeeResponse)
+    if DB_ASYNC and not columns and not expansions:
+        # Concurrent lookups of single coffees share one query
+        db_coffee = load_row("coffees", coffee_id)
+    else:
+        db_coffee = (
+            db.query(Coffee)
+            .options(
+                *loader_options(Coffee, expansions),
+                *load_fields(Coffee, columns, Coffee.updated_at, Coffee.producer_id)
+            )
+            .filter(Coffee.coffee_id == coffee_id)
+            .first()
+        )
     if db_coffee is None:
         raise HTTPException(status_code=404, detail="Coffee not found")
+    
+    if expansions:
+        return expanded_response(Coffee, expansions, db_coffee, response, fields=columns)
+    unchanged = conditional(request, response, row_etag("coffees", coffee_id, db_coffee.updated_at, *columns))
+    if unchanged:
+        return unchanged
+    if columns:
+        return row_response(CoffeeResponse, columns, db_coffee, response)
     return db_coffee
 
 @router.put("/coffees/{coffee_id}", response_model=CoffeeResponse)
+@router.patch("/coffees/{coffee_id}", response_model=CoffeeResponse)
+@session_endpoint
 def update_coffee(coffee_id: int, coffee: CoffeeUpdate, db: Session = Depends(get_db)):
     """
-    Update a coffee entry
+    Update the given fields of a coffee entry with one UPDATE ... RETURNING;
+    the foreign key checks producer_id
     """
-    db_coffee = db.query(Coffee).filter(Coffee.coffee_id == coffee_id).first()
+    update_data = coffee.dict(exclude_unset=True)
+    values = dict(update_data)
+    
+    # Recalculate total cup points in the UPDATE if relevant fields were updated,
+    # keeping the stored values when a score is missing
+    if any(field in update_data for field in COFFEE_SCORE_FIELDS):
+        total_points = coffee_total_sql(_assigned(Coffee, update_data))
+        values["total_cup_points"] = func.coalesce(total_points, Coffee.total_cup_points)
+        values["quality_classification"] = func.coalesce(classify_sql(total_points), Coffee.quality_classification)
+    
+    db_coffee = _update_returning(db, Coffee, coffee_id, values, "Producer")
     if db_coffee is None:
         raise HTTPException(status_code=404, detail="Coffee not found")
     
-    update_data = coffee.dict(exclude_unset=True)
-    if "producer_id" in update_data:
-        db_producer = db.query(Producer).filter(Producer.producer_id == update_data["producer_id"]).first()
-        if db_producer is None:
-            raise HTTPException(status_code=404, detail="Producer not found")
-    
-    for key, value in update_data.items():
-        setattr(db_coffee, key, value)
-    
-    # Recalculate total cup points if relevant fields were updated
-    score_fields = ['aroma', 'flavor', 'aftertaste', 'acidity', 'body', 'balance', 'uniformity', 'clean_cup', 'sweetness']
-    if any(field in update_data for field in score_fields) and all(getattr(db_coffee, field) is not None for field in score_fields):
-        total_points = (
-            db_coffee.aroma + 
-            db_coffee.flavor + 
-            db_coffee.aftertaste + 
-            db_coffee.acidity + 
-            db_coffee.body + 
-            db_coffee.balance + 
-            db_coffee.uniformity + 
-            db_coffee.clean_cup + 
-            db_coffee.sweetness
-        )
-        
-        db_coffee.total_cup_points = total_points
-        
-        if total_points >= 80:
-            db_coffee.quality_classification = "Specialty"
-        elif total_points >= 70:
-            db_coffee.quality_classification = "Premium"
-        else:
-            db_coffee.quality_classification = "Standard"
-    
+    record_change(db, "coffees", "update", coffee_id)
     db.commit()
-    db.refresh(db_coffee)
     return db_coffee
 
 @router.delete("/coffees/{coffee_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_coffee(coffee_id: int, db: Session = Depends(get_db)):
+@session_endpoint
+def delete_coffee(
+    coffee_id: int,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    batch_size: int = purge.DEFAULT_BATCH_SIZE,
+    db: Session = Depends(get_db)
+):
     """
-    Delete a coffee entry and all related data
+    Delete a coffee entry and all related data with one DELETE; the foreign keys
+    cascade it in the database. background=true deletes it in batches of batch_size
+    rows instead and answers 202 with a job followed at /api/admin/jobs/{job_name}.
     """
-    db_coffee = db.query(Coffee).filter(Coffee.coffee_id == coffee_id).first()
-    if db_coffee is None:
+    if background:
+        return _start_purge(background_tasks, db, "coffees", coffee_id, batch_size)
+    
+    deleted = db.execute(delete(Coffee).where(Coffee.coffee_id == coffee_id).returning(Coffee.coffee_id)).scalar()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Coffee not found")
     
-    db.delete(db_coffee)
+    record_change(db, "coffees", "delete", coffee_id)
     db.commit()
     return None
 
 # Cupping Score endpoints
 @router.post("/cupping-scores/", response_model=CuppingScoreResponse, status_code=status.HTTP_201_CREATED)
+@session_endpoint
 def create_cupping_score(cupping_score: CuppingScoreCreate, db: Session = Depends(get_db)):
     """
     Create a new cupping score entry
@@ -298,152 +977,269 @@ def create_cupping_score(cupping_score: CuppingScoreCreate, db: Session = Depend
     new_cupping_score = CuppingScore(**cupping_score.dict())
     
     # Calculate total score if all required fields are provided
-    score_fields = [
-        'fragrance_aroma', 'flavor', 'aftertaste', 'acidity', 
-        'body', 'balance', 'uniformity', 'clean_cup', 
-        'sweetness', 'overall'
-    ]
-    
-    if all(getattr(new_cupping_score, field) is not None for field in score_fields):
-        defects = new_cupping_score.defects or 0
-        
-        total_score = (
-            new_cupping_score.fragrance_aroma + 
-            new_cupping_score.flavor + 
-            new_cupping_score.aftertaste + 
-            new_cupping_score.acidity + 
-            new_cupping_score.body + 
-            new_cupping_score.balance + 
-            new_cupping_score.uniformity + 
-            new_cupping_score.clean_cup + 
-            new_cupping_score.sweetness + 
-            new_cupping_score.overall - 
-            defects
-        )
-        
+    total_score = score_cupping(new_cupping_score)
+    if total_score is not None:
         new_cupping_score.total_score = total_score
     
     db.add(new_cupping_score)
+    db.flush()
+    add_observations(db, [new_cupping_score])
+    record_change(db, "cupping_scores", "insert", new_cupping_score.score_id)
     db.commit()
     db.refresh(new_cupping_score)
     return new_cupping_score
 
+@router.post("/cupping-sessions", response_model=CuppingSessionResponse, status_code=status.HTTP_201_CREATED)
+@session_endpoint
+def create_cupping_session(session: CuppingSessionCreate, db: Session = Depends(get_db)):
+    """
+    Submit every score of a cupping session (cuppers by coffees) in one transaction.
+
+    All coffees are checked with one query and nothing is inserted if any is missing.
+    Scores without a tasting_date take the session's. Each coffee's cupping
+    aggregates are updated once, however many scores it received.
+    """
+    if len(session.scores) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} scores per session")
+    if not session.scores:
+        return CuppingSessionResponse(created=0, coffees=0, scores=[])
+    
+    rows = [score.dict() for score in session.scores]
+    coffee_ids = {row["coffee_id"] for row in rows}
+    known_coffees = set(db.scalars(select(Coffee.coffee_id).where(Coffee.coffee_id.in_(coffee_ids))).all())
+    missing = [
+        {"index": index, "status": "rejected", "error": "Coffee not found"}
+        for index, row in enumerate(rows) if row["coffee_id"] not in known_coffees
+    ]
+    if missing:
+        raise HTTPException(status_code=422, detail=missing)
+    
+    totals = score_cupping_batch(columns_from_rows(rows, CUPPING_SCORE_FIELDS + ("defects",)))
+    now = datetime.utcnow()
+    for row, total_score in zip(rows, to_optional_list(totals)):
+        row["total_score"] = total_score
+        row["tasting_date"] = row["tasting_date"] or session.tasting_date
+        row["created_at"] = now
+        row["updated_at"] = now
+    
+    scores = db.execute(
+        insert(CuppingScore.__table__).returning(*CuppingScore.__table__.columns, sort_by_parameter_order=True),
+        rows
+    ).mappings().all()
+    add_observations(db, scores)
+    record_change(db, "cupping_scores", "insert")
+    db.commit()
+    return CuppingSessionResponse(created=len(scores), coffees=len(coffee_ids), scores=scores)
+
 @router.get("/cupping-scores/", response_model=List[CuppingScoreResponse])
-def read_cupping_scores(skip: int = 0, limit: int = 100, coffee_id: Optional[int] = None, db: Session = Depends(get_db)):
+@cached("cupping_scores", List[CuppingScoreResponse])
+@session_endpoint
+def read_cupping_scores(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    coffee_id: Optional[int] = None,
+    ids: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get a list of cupping scores with optional coffee_id filter and pagination
+    Get a list of cupping scores with optional coffee_id filter, sorting and pagination.
+    ids=1,2,3 returns those cupping scores instead, in that order, without paging;
+    fields=a,b limits the response (and the SELECT) to those fields.
     """
-    query = db.query(CuppingScore)
+    columns = parse_fields(fields, CuppingScoreResponse)
+    query = select_rows(CuppingScore, CuppingScoreResponse, columns)
     
     if coffee_id:
         query = query.filter(CuppingScore.coffee_id == coffee_id)
+    if ids is not None:
+        return _read_by_ids(db, response, CuppingScore, CuppingScoreResponse, query, parse_ids(ids), columns)
     
-    cupping_scores = query.offset(skip).limit(limit).all()
-    return cupping_scores
+    cupping_scores, versions = paginate_versioned_rows(
+        db, query, response, CuppingScore.score_id, CuppingScore.updated_at,
+        {
+            "score_id": CuppingScore.score_id,
+            "total_score": CuppingScore.total_score,
+            "created_at": CuppingScore.created_at,
+        },
+        sort=sort, cursor=cursor, skip=skip, limit=limit
+    )
+    etag = page_etag("cupping_scores", versions, response.headers.get(NEXT_CURSOR_HEADER), request.url.query)
+    unchanged = conditional(request, response, etag)
+    if unchanged:
+        return unchanged
+    return rows_response(CuppingScoreResponse, cupping_scores, response, columns)
+
+@router.post("/cupping-scores/batch-get", response_model=List[CuppingScoreResponse])
+@session_endpoint
+def batch_get_cupping_scores(
+    batch: BatchGetRequest,
+    response: Response,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get the cupping scores with the given ids, in that order; missing ids are left out
+    """
+    columns = parse_fields(fields, CuppingScoreResponse)
+    query = select_rows(CuppingScore, CuppingScoreResponse, columns)
+    return _read_by_ids(db, response, CuppingScore, CuppingScoreResponse, query, check_ids(batch.ids), columns)
 
 @router.get("/cupping-scores/{score_id}", response_model=CuppingScoreResponse)
-def read_cupping_score(score_id: int, db: Session = Depends(get_db)):
+@cached("cupping_scores", CuppingScoreResponse, id_param="score_id")
+@session_endpoint
+def read_cupping_score(
+    score_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get a specific cupping score by ID
+    Get a specific cupping score by ID, optionally limited to some fields
     """
-    db_cupping_score = db.query(CuppingScore).filter(CuppingScore.score_id == score_id).first()
+    columns = parse_fields(fields, CuppingScoreResponse)
+    if DB_ASYNC and not columns:
+        # Concurrent lookups of single cupping scores share one query
+        db_cupping_score = load_row("cupping_scores", score_id)
+    else:
+        db_cupping_score = (
+            db.query(CuppingScore)
+            .options(*load_fields(CuppingScore, columns, CuppingScore.updated_at, CuppingScore.coffee_id))
+            .filter(CuppingScore.score_id == score_id)
+            .first()
+        )
     if db_cupping_score is None:
         raise HTTPException(status_code=404, detail="Cupping score not found")
+    
+    unchanged = conditional(
+        request, response, row_etag("cupping_scores", score_id, db_cupping_score.updated_at, *columns)
+    )
+    if unchanged:
+        return unchanged
+    if columns:
+        return row_response(CuppingScoreResponse, columns, db_cupping_score, response)
     return db_cupping_score
 
 @router.put("/cupping-scores/{score_id}", response_model=CuppingScoreResponse)
+@router.patch("/cupping-scores/{score_id}", response_model=CuppingScoreResponse)
+@session_endpoint
 def update_cupping_score(score_id: int, cupping_score: CuppingScoreUpdate, db: Session = Depends(get_db)):
     """
-    Update a cupping score entry
+    Update the given fields of a cupping score entry with one UPDATE ... RETURNING
     """
-    db_cupping_score = db.query(CuppingScore).filter(CuppingScore.score_id == score_id).first()
-    if db_cupping_score is None:
-        raise HTTPException(status_code=404, detail="Cupping score not found")
-    
     update_data = cupping_score.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_cupping_score, key, value)
-    
-    # Recalculate total score if any score field was updated
-    score_fields = [
-        'fragrance_aroma', 'flavor', 'aftertaste', 'acidity', 
-        'body', 'balance', 'uniformity', 'clean_cup', 
-        'sweetness', 'overall'
-    ]
+    values = dict(update_data)
     
-    if any(field in update_data for field in score_fields) and all(getattr(db_cupping_score, field) is not None for field in score_fields):
-        defects = db_cupping_score.defects or 0
-        
-        total_score = (
-            db_cupping_score.fragrance_aroma + 
-            db_cupping_score.flavor + 
-            db_cupping_score.aftertaste + 
-            db_cupping_score.acidity + 
-            db_cupping_score.body + 
-            db_cupping_score.balance + 
-            db_cupping_score.uniformity + 
-            db_cupping_score.clean_cup + 
-            db_cupping_score.sweetness + 
-            db_cupping_score.overall - 
-            defects
-        )
-        
-        db_cupping_score.total_score = total_score
+    # Recalculate total score in the UPDATE if any score field was updated
+    if any(field in update_data for field in CUPPING_SCORE_FIELDS):
+        total_score = cupping_total_sql(_assigned(CuppingScore, update_data))
+        values["total_score"] = func.coalesce(total_score, CuppingScore.total_score)
+    
+    # The aggregates need the values being replaced, returned by the same UPDATE
+    aggregated = ("coffee_id",) + AGGREGATE_FIELDS
+    previous = aggregated if set(values) & set(aggregated) else ()
+    db_cupping_score = _update_returning(db, CuppingScore, score_id, values, previous=previous)
+    if db_cupping_score is None:
+        raise HTTPException(status_code=404, detail="Cupping score not found")
     
+    if previous:
+        update_observations(db, {name: db_cupping_score[f"previous_{name}"] for name in previous}, db_cupping_score)
+    record_change(db, "cupping_scores", "update", score_id)
     db.commit()
-    db.refresh(db_cupping_score)
     return db_cupping_score
 
 @router.delete("/cupping-scores/{score_id}", status_code=status.HTTP_204_NO_CONTENT)
+@session_endpoint
 def delete_cupping_score(score_id: int, db: Session = Depends(get_db)):
     """
     Delete a cupping score entry
     """
-    db_cupping_score = db.query(CuppingScore).filter(CuppingScore.score_id == score_id).first()
-    if db_cupping_score is None:
+    deleted = db.execute(
+        delete(CuppingScore).where(CuppingScore.score_id == score_id)
+        .returning(CuppingScore.coffee_id, *[getattr(CuppingScore, name) for name in AGGREGATE_FIELDS])
+    ).mappings().first()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Cupping score not found")
     
-    db.delete(db_cupping_score)
+    remove_observations(db, [deleted])
+    record_change(db, "cupping_scores", "delete", score_id)
     db.commit()
     return None
 
+@router.get("/coffees/{coffee_id}/cupping-summary", response_model=CuppingSummaryResponse)
+@cached("cupping_scores", CuppingSummaryResponse, depends_on=("coffees",))
+@session_endpoint
+def read_cupping_summary(coffee_id: int, db: Session = Depends(get_db)):
+    """
+    Count, mean, variance and stddev of each cupping attribute and total_score over
+    a coffee's cupping scores, read from the incrementally maintained aggregates
+    """
+    if db.get(Coffee, coffee_id) is None:
+        raise HTTPException(status_code=404, detail="Coffee not found")
+    return cupping_summary(db, coffee_id)
+
 # Latest entry endpoints
-@router.get("/coffees/latest/", response_model=CoffeeResponse)
-def get_latest_coffee(db: Session = Depends(get_db)):
-    print("Fetching latest coffee...")
-    count = db.query(Coffee).count()
-    print(f"Total coffee count: {count}")
-    
-    if count > 0:
-        # Show a sample coffee to verify data
-        sample = db.query(Coffee).first()
-        print(f"Sample coffee: ID={sample.coffee_id}, Producer={sample.producer_id}")
-    
-    latest_coffee = db.query(Coffee).order_by(Coffee.created_at.desc()).first()
-    
-    if latest_coffee is None:
-        print("No latest coffee found!")
-        raise HTTPException(status_code=404, detail="No coffee entries found")
+def _latest(db, response, entity, model, n, cursor, not_found):
+    """
+    The newest row of entity with one index lookup, or with n the newest n rows as a
+    keyset-paged feed continued with the X-Next-Cursor cursor
+    """
+    id_column = entity.__table__.primary_key.columns[0]
+    statement = select_rows(entity, model)
+    if n is None:
+        latest = db.connection().execute(
+            newest_first(statement, id_column, entity.created_at).limit(1)
+        ).mappings().first()
+        if latest is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        return latest
     
-    print(f"Found latest coffee: ID={latest_coffee.coffee_id}")
-    return latest_coffee
+    rows = paginate_latest(db, statement, response, id_column, entity.created_at, cursor, n)
+    return rows_response(model, rows, response)
 
-@router.get("/producers/latest/", response_model=ProducerResponse)
-def get_latest_producer(db: Session = Depends(get_db)):
+@router.get("/coffees/latest/", response_model=Union[CoffeeResponse, List[CoffeeResponse]])
+@cached("coffees", CoffeeResponse)
+@session_endpoint
+def get_latest_coffee(
+    response: Response,
+    n: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get the most recently added producer
+    Get the most recently added coffee, or with n a list of the n most recent ones
     """
-    latest_producer = db.query(Producer).order_by(Producer.created_at.desc()).first()
-    if latest_producer is None:
-        raise HTTPException(status_code=404, detail="No producer entries found")
-    return latest_producer
+    return _latest(db, response, Coffee, CoffeeResponse, n, cursor, "No coffee entries found")
 
-@router.get("/cupping-scores/latest/", response_model=CuppingScoreResponse)
-def get_latest_cupping_score(db: Session = Depends(get_db)):
+@router.get("/producers/latest/", response_model=Union[ProducerResponse, List[ProducerResponse]])
+@cached("producers", ProducerResponse)
+@session_endpoint
+def get_latest_producer(
+    response: Response,
+    n: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get the most recently added producer, or with n a list of the n most recent ones
+    """
+    return _latest(db, response, Producer, ProducerResponse, n, cursor, "No producer entries found")
+
+@router.get("/cupping-scores/latest/", response_model=Union[CuppingScoreResponse, List[CuppingScoreResponse]])
+@cached("cupping_scores", CuppingScoreResponse)
+@session_endpoint
+def get_latest_cupping_score(
+    response: Response,
+    n: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    Get the most recently added cupping score
+    Get the most recently added cupping score, or with n a list of the n most recent ones
     """
-    latest_score = db.query(CuppingScore).order_by(CuppingScore.created_at.desc()).first()
-    if latest_score is None:
-        raise HTTPException(status_code=404, detail="No cupping score entries found")
-    return latest_score
\ No newline at end of file
+    return _latest(db, response, CuppingScore, CuppingScoreResponse, n, cursor, "No cupping score entries found")
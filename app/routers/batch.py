@@ -0,0 +1,53 @@
+import os
+from fastapi import HTTPException
+from sqlalchemy import Integer, any_, bindparam
+from sqlalchemy.dialects import postgresql
+
+# Most ids one ?ids= or batch-get request may ask for
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", 1000))
+
+def check_ids(ids):
+    """
+    ids without duplicates, in the order first asked for
+    """
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids can be requested at once")
+    return ids
+
+def parse_ids(ids):
+    """
+    Parse ?ids=1,2,3 into a list of ids
+    """
+    try:
+        return check_ids(int(part) for part in ids.split(",") if part.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+
+def with_ids(id_column, ids):
+    """
+    id_column = ANY(:ids), one array parameter however many ids there are
+    """
+    return id_column == any_(bindparam("ids", ids, type_=postgresql.ARRAY(Integer)))
+
+def in_order(rows, ids, id_of):
+    """
+    rows sorted in the order of ids
+    """
+    position = {row_id: index for index, row_id in enumerate(ids)}
+    return sorted(rows, key=lambda row: position[id_of(row)])
+
+def select_by_ids(db, statement, id_column, ids):
+    """
+    Rows of a Core select with the given ids, as dicts in the order of ids. The id
+    column is fetched for the ordering even when the select leaves it out.
+    """
+    extra = id_column.key not in statement.selected_columns
+    if extra:
+        statement = statement.add_columns(id_column)
+    rows = [dict(row) for row in db.connection().execute(statement.where(with_ids(id_column, ids))).mappings()]
+    rows = in_order(rows, ids, lambda row: row[id_column.key])
+    if extra:
+        for row in rows:
+            del row[id_column.key]
+    return rows
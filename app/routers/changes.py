@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.config.database import get_db, session_endpoint
+from app.models.models import ChangesResponse
+from app.services.changes import DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT, changes_since
+
+router = APIRouter()
+
+@router.get("/changes", response_model=ChangesResponse)
+@session_endpoint
+def read_changes(
+    since: Optional[str] = None,
+    limit: int = Query(DEFAULT_CHANGES_LIMIT, ge=1, le=MAX_CHANGES_LIMIT),
+    db: Session = Depends(get_db)
+):
+    """
+    Countries, producers, coffees and cupping scores inserted, updated ("upsert",
+    with the row as it is now) or deleted ("delete") since the since token, oldest
+    first. Pass next back as since to continue; has_more means the next page is
+    ready now. Without since only a token is returned: take it, download the tables,
+    then sync from it.
+    """
+    try:
+        return changes_since(db, since, limit)
+    except (ValueError, TypeError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid change token")
@@ -0,0 +1,48 @@
+import hashlib
+from fastapi import Response
+
+def make_etag(*parts):
+    """
+    Strong ETag from the values that determine a response body
+    """
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+def row_etag(table, row_id, updated_at, *params):
+    return make_etag(table, row_id, updated_at.isoformat() if updated_at else None, *params)
+
+def page_etag(table, versions, next_cursor, *params):
+    """
+    ETag for a list page from the (id, updated_at) pairs of its rows and its next
+    cursor: any insert, update or delete that changes the page changes one of them
+    """
+    return make_etag(
+        table, *[f"{row_id}@{updated_at.isoformat() if updated_at else None}" for row_id, updated_at in versions],
+        next_cursor, *params
+    )
+
+def etag_matches(request, etag):
+    """
+    If-None-Match check with the weak comparison RFC 9110 prescribes for it
+    """
+    if request is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag})
+
+def conditional(request, response, etag):
+    """
+    Set the ETag on the response; return a 304 response if the client already has it
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    return None
@@ -0,0 +1,108 @@
+from functools import lru_cache
+from typing import List, Optional
+from fastapi import HTTPException, Response
+from pydantic import TypeAdapter, create_model
+from sqlalchemy.orm import joinedload, selectinload
+from app.routers.rows import MODEL_CACHE_SIZE, trimmed_model
+from app.models.models import (
+    Country, Producer, Coffee, CuppingScore,
+    CountryResponse, ProducerResponse, CoffeeResponse, CuppingScoreResponse
+)
+
+# relationship name -> (attribute, target entity, one-to-many)
+RELATIONSHIPS = {
+    Coffee: {
+        "producer": (Coffee.producer, Producer, False),
+        "cupping_scores": (Coffee.cupping_scores, CuppingScore, True),
+    },
+    Producer: {
+        "country": (Producer.country, Country, False),
+        "coffees": (Producer.coffees, Coffee, True),
+    },
+    Country: {},
+    CuppingScore: {},
+}
+
+RESPONSE_MODELS = {
+    Country: CountryResponse,
+    Producer: ProducerResponse,
+    Coffee: CoffeeResponse,
+    CuppingScore: CuppingScoreResponse,
+}
+
+COFFEE_EXPANSIONS = ("producer", "producer.country", "cupping_scores")
+PRODUCER_EXPANSIONS = ("country", "coffees", "coffees.cupping_scores")
+
+def parse_expand(expand, allowed):
+    """
+    Parse ?expand=a,a.b into a nested tuple tree ((name, subtree), ...), rejecting
+    paths not in allowed. A nested path implies its parents.
+    """
+    if not expand:
+        return ()
+    paths = {path.strip() for path in expand.split(",") if path.strip()}
+    unknown = paths - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid expand: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}"
+        )
+
+    tree = {}
+    for path in sorted(paths):
+        node = tree
+        for name in path.split("."):
+            node = node.setdefault(name, {})
+
+    def freeze(node):
+        return tuple(sorted((name, freeze(child)) for name, child in node.items()))
+    return freeze(tree)
+
+def loader_options(entity, tree, parent=None):
+    """
+    Eager loading options for an expand tree, costing at most one extra query per
+    collection: joinedload for many-to-one, selectinload for a top level collection
+    (bounded by the page size) and subqueryload below it, since a nested collection
+    can span more parent ids than selectinload fetches per IN batch
+    """
+    options = []
+    for name, subtree in tree:
+        attribute, target, many = RELATIONSHIPS[entity][name]
+        if parent is None:
+            loader = selectinload(attribute) if many else joinedload(attribute)
+        else:
+            loader = parent.subqueryload(attribute) if many else parent.joinedload(attribute)
+        children = loader_options(target, subtree, loader)
+        options.extend(children or [loader])
+    return options
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def expanded_model(entity, tree, fields=()):
+    """
+    Response model for entity, narrowed to fields, with the relationships in tree
+    nested in it. Cached per combination.
+    """
+    base = trimmed_model(RESPONSE_MODELS[entity], fields)
+    if not tree:
+        return base
+    relations = {}
+    for name, subtree in tree:
+        _, target, many = RELATIONSHIPS[entity][name]
+        nested = expanded_model(target, subtree)
+        relations[name] = (List[nested], []) if many else (Optional[nested], None)
+    suffix = "".join(name.title().replace("_", "") for name, _ in tree)
+    return create_model(f"{base.__name__}With{suffix}", __base__=base, **relations)
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _adapter(entity, tree, many, fields):
+    model = expanded_model(entity, tree, fields)
+    return TypeAdapter(List[model] if many else model)
+
+def expanded_response(entity, tree, result, response, many=False, fields=()):
+    """
+    Serialize ORM result with its expanded relationships, keeping headers already
+    set on the injected response
+    """
+    adapter = _adapter(entity, tree, many, fields)
+    body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
@@ -0,0 +1,155 @@
+import base64
+import json
+import os
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import or_, and_, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Largest limit a list endpoint accepts
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+def encode_cursor(sort, value, row_id):
+    """
+    Build an opaque cursor from the sort key, its value and the row id of the last row
+    """
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, sort, sort_column):
+    """
+    Decode a cursor produced by encode_cursor for the same sort key
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if value is not None and sort_column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        row_id = int(row_id)
+    except (ValueError, TypeError, NotImplementedError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+    return value, row_id
+
+def _after(sort_column, id_column, value, row_id, descending):
+    """
+    Keyset predicate selecting rows after (value, row_id). NULL sort values come last.
+    """
+    if sort_column is id_column:
+        return id_column < row_id if descending else id_column > row_id
+    if value is None:
+        return and_(sort_column.is_(None), id_column < row_id if descending else id_column > row_id)
+    position = tuple_(sort_column, id_column)
+    return or_(position < (value, row_id) if descending else position > (value, row_id), sort_column.is_(None))
+
+def _keyset(query, id_column, sortable, sort, cursor, skip, limit):
+    """
+    Apply the ordering, cursor or offset and limit (plus one) of a page to an ORM
+    query or Core select
+    """
+    sort = sort or id_column.key
+    descending = sort.startswith("-")
+    sort_column = sortable.get(sort.lstrip("-"))
+    if sort_column is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort, expected one of: {', '.join(sorted(sortable))}"
+        )
+
+    if descending:
+        order = [id_column.desc()] if sort_column is id_column else [sort_column.desc().nulls_last(), id_column.desc()]
+    else:
+        order = [id_column.asc()] if sort_column is id_column else [sort_column.asc().nulls_last(), id_column.asc()]
+    query = query.order_by(*order)
+
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort, sort_column)
+        query = query.filter(_after(sort_column, id_column, value, row_id, descending))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit + 1), sort, sort_column
+
+def _trim(rows, response, limit, sort, sort_column, id_column, value_of):
+    if len(rows) > limit > 0:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            sort, value_of(last, sort_column.key), value_of(last, id_column.key)
+        )
+    return rows
+
+def paginate(query, response, id_column, sortable, sort=None, cursor=None, skip=0, limit=100):
+    """
+    Page a query by keyset (cursor) or, for old clients, by offset (skip).
+
+    sortable maps the allowed sort keys to columns; a leading "-" on sort means
+    descending. Ties are broken on id_column. When more rows remain, the cursor
+    for the next page is returned in the X-Next-Cursor response header.
+    """
+    query, sort, sort_column = _keyset(query, id_column, sortable, sort, cursor, skip, limit)
+    return _trim(query.all(), response, limit, sort, sort_column, id_column, getattr)
+
+def _page_rows(db, statement, response, id_column, sortable, sort, cursor, skip, limit, also=()):
+    """
+    Run a page of a Core select as dicts, fetching the id, sort and also columns
+    even when the select leaves them out; returns the rows and the columns to drop
+    """
+    statement, sort, sort_column = _keyset(statement, id_column, sortable, sort, cursor, skip, limit)
+    needed = {column.key: column for column in (id_column, sort_column, *also)}
+    extra = [column for column in needed.values() if column.key not in statement.selected_columns]
+    if extra:
+        statement = statement.add_columns(*extra)
+    rows = [dict(row) for row in db.connection().execute(statement).mappings()]
+    rows = _trim(rows, response, limit, sort, sort_column, id_column, dict.__getitem__)
+    return rows, extra
+
+def _drop(rows, columns):
+    for row in rows:
+        for column in columns:
+            del row[column.key]
+    return rows
+
+def paginate_rows(db, statement, response, id_column, sortable, sort=None, cursor=None, skip=0, limit=100):
+    """
+    paginate for a Core select: runs it on the session's connection, bypassing the
+    ORM and its identity map, and returns the page as plain dicts. The sort and id
+    columns are fetched for the cursor even when the select leaves them out.
+    """
+    rows, extra = _page_rows(db, statement, response, id_column, sortable, sort, cursor, skip, limit)
+    return _drop(rows, extra)
+
+def paginate_versioned_rows(
+    db, statement, response, id_column, version_column, sortable, sort=None, cursor=None, skip=0, limit=100
+):
+    """
+    paginate_rows plus the (id, version_column) pair of every row of the page, from
+    the same query, to build the page's ETag
+    """
+    rows, extra = _page_rows(db, statement, response, id_column, sortable, sort, cursor, skip, limit, (version_column,))
+    versions = [(row[id_column.key], row[version_column.key]) for row in rows]
+    return _drop(rows, extra), versions
+
+def newest_first(statement, id_column, created_column):
+    """
+    Order a select newest first so the (created_column, id_column) index is read
+    backwards. Rows without a created_column value are left out: NULLS LAST, as
+    the sortable lists use, would make Postgres sort the whole table instead.
+    """
+    return statement.where(created_column.is_not(None)).order_by(created_column.desc(), id_column.desc())
+
+def paginate_latest(db, statement, response, id_column, created_column, cursor=None, limit=100):
+    """
+    Keyset page of the newest rows of a Core select, as dicts. Cursors are
+    interchangeable with those of sort=-<created_column> on the list endpoints.
+    """
+    sort = f"-{created_column.key}"
+    statement = newest_first(statement, id_column, created_column)
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort, created_column)
+        statement = statement.where(tuple_(created_column, id_column) < (value, row_id))
+    rows = [dict(row) for row in db.connection().execute(statement.limit(limit + 1)).mappings()]
+    return _trim(rows, response, limit, sort, created_column, id_column, dict.__getitem__)
@@ -0,0 +1,57 @@
+import inspect
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.datastructures import Default
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional accelerator
+    orjson = None
+
+# auto: FastJSONResponse unless FastAPI already dumps response models straight to JSON
+# bytes (newer releases do, but only while the default response class is left alone)
+# fast: always FastJSONResponse; standard: Starlette's JSONResponse
+JSON_RESPONSE = os.getenv("JSON_RESPONSE", "auto").lower()
+
+FASTAPI_DUMPS_JSON = "dump_json" in inspect.signature(serialize_response).parameters
+
+def _default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def dumps(content):
+    """
+    Encode content to JSON bytes with orjson when it is installed, else the stdlib
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse that encodes pydantic models, dates and floats directly to bytes
+    """
+    def render(self, content):
+        return dumps(content)
+
+def default_response_class():
+    """
+    Response class for FastAPI(default_response_class=...) according to JSON_RESPONSE
+    """
+    if JSON_RESPONSE not in ("auto", "fast", "standard"):
+        raise ValueError(f"Invalid JSON_RESPONSE {JSON_RESPONSE!r}, expected auto, fast or standard")
+    if JSON_RESPONSE == "fast" or (JSON_RESPONSE == "auto" and not FASTAPI_DUMPS_JSON):
+        return FastJSONResponse
+    return Default(JSONResponse)
@@ -0,0 +1,98 @@
+from functools import lru_cache
+from typing import List
+from fastapi import HTTPException, Response
+from pydantic import TypeAdapter, create_model
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+from typing_extensions import TypedDict
+
+# Models and adapters kept per ?fields= combination; clients choose the combinations,
+# so the caches are bounded and the least recently used ones are rebuilt on demand
+MODEL_CACHE_SIZE = 256
+
+class RowsResponse(Response):
+    """
+    JSON serialized straight from rows; the response cache stores its body as is.
+    source is the row a detail response was built from, used to tag its cache entry.
+    """
+    media_type = "application/json"
+
+    def __init__(self, content, headers=None, source=None):
+        super().__init__(content=content, headers=headers)
+        self.source = source
+
+def parse_fields(fields, model):
+    """
+    Parse ?fields=a,b into a tuple of model field names in model order; () means all
+    """
+    if not fields:
+        return ()
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(model.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(model.model_fields)}"
+        )
+    return tuple(name for name in model.model_fields if name in names)
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def trimmed_model(model, fields=()):
+    """
+    model narrowed to fields, cached per combination
+    """
+    if not fields:
+        return model
+    return create_model(
+        f"{model.__name__}Fields",
+        __config__=model.model_config,
+        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields}
+    )
+
+def load_fields(entity, fields, *required):
+    """
+    load_only option limiting an ORM query to fields plus the required columns
+    """
+    if not fields:
+        return []
+    return [load_only(*[getattr(entity, name) for name in fields], *required)]
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _columns(entity, model):
+    return tuple(entity.__table__.c[name] for name in model.model_fields)
+
+def select_rows(entity, model, fields=()):
+    """
+    Core select of exactly the columns model (narrowed to fields) exposes, for reads
+    that skip the ORM
+    """
+    return select(*_columns(entity, trimmed_model(model, fields)))
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _adapter(model):
+    # Rows come from typed columns, so they are dumped against a TypedDict mirror of the
+    # model without building model instances or validating them again
+    row_type = TypedDict(
+        f"{model.__name__}Row", {name: field.annotation for name, field in model.model_fields.items()}
+    )
+    return TypeAdapter(List[row_type])
+
+def rows_response(model, rows, response, fields=()):
+    """
+    Serialize row dicts as a list of model (narrowed to fields), keeping headers
+    already set on the injected response
+    """
+    body = _adapter(trimmed_model(model, fields)).dump_json(rows)
+    return RowsResponse(content=body, headers=dict(response.headers))
+
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _object_adapter(model):
+    return TypeAdapter(model)
+
+def row_response(model, fields, instance, response):
+    """
+    Serialize one ORM instance loaded with load_fields as model narrowed to fields
+    """
+    adapter = _object_adapter(trimmed_model(model, fields))
+    body = adapter.dump_json(adapter.validate_python(instance, from_attributes=True))
+    return RowsResponse(content=body, headers=dict(response.headers), source=instance)
@@ -0,0 +1,86 @@
+import asyncio
+import os
+from fastapi import HTTPException, Response
+from fastapi.routing import APIRoute
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Request headers that can change a read response, part of the single-flight key
+SINGLE_FLIGHT_HEADERS = ("accept", "accept-encoding", "authorization", "cookie", "if-none-match")
+
+class SingleFlight:
+    """
+    Identical GET requests in flight at the same time, keyed by path, query string
+    and SINGLE_FLIGHT_HEADERS: the first (leader) runs, the others wait and get a
+    copy of its response instead of running the same queries again. HTTP errors are
+    shared too; a streamed response or any other error makes each waiting request
+    run on its own.
+    """
+    def __init__(self):
+        self._flights = {}
+        self.executions = 0
+        self.shared = 0
+        self.fallbacks = 0
+
+    def key(self, request):
+        headers = tuple((name, request.headers.get(name)) for name in SINGLE_FLIGHT_HEADERS)
+        return (request.url.path, request.url.query, headers)
+
+    async def run(self, key, call):
+        flight = self._flights.get(key)
+        if flight is not None:
+            outcome = await asyncio.shield(flight)
+            if isinstance(outcome, HTTPException):
+                self.shared += 1
+                raise outcome
+            if outcome is not None:
+                self.shared += 1
+                status_code, headers, body = outcome
+                response = Response(content=body, status_code=status_code)
+                response.raw_headers = list(headers)
+                return response
+            self.fallbacks += 1
+            return await call()
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self.executions += 1
+        outcome = None
+        try:
+            response = await call()
+            # Streamed bodies are not held in memory to be shared
+            if hasattr(response, "body") and response.background is None:
+                outcome = (response.status_code, response.raw_headers, response.body)
+            return response
+        except HTTPException as error:
+            outcome = error
+            raise
+        finally:
+            del self._flights[key]
+            flight.set_result(outcome)
+
+    def stats(self):
+        return {
+            "enabled": SINGLE_FLIGHT_ENABLED,
+            "in_flight": len(self._flights),
+            "executions": self.executions + self.fallbacks,
+            "saved_executions": self.shared,
+            "fallbacks": self.fallbacks,
+        }
+
+single_flight = SingleFlight()
+
+class SingleFlightRoute(APIRoute):
+    """
+    Route class coalescing identical concurrent GET requests through single_flight;
+    set as a router's route_class to cover all its read routes
+    """
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if not SINGLE_FLIGHT_ENABLED or "GET" not in self.methods:
+            return handler
+
+        async def route_handler(request):
+            return await single_flight.run(single_flight.key(request), lambda: handler(request))
+
+        return route_handler
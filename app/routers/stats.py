@@ -0,0 +1,127 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from app.config.database import get_db, session_endpoint
+from app.models.models import RollupRefresh, RollupStatus, StatsResponse
+from app.services.cache import cached
+from app.services.rollups import ROLLUP_TABLE, find_rollup, rollup_query, rollup_status
+from app.services.stats import (
+    GROUP_COLUMNS, DEFAULT_PERCENTILES, STATS_SOURCES, stats_query, stats_groups
+)
+
+router = APIRouter()
+
+def _names(value, allowed, param):
+    """
+    Parse a comma separated list of names, rejecting those not in allowed
+    """
+    names = [name.strip() for name in value.split(",") if name.strip()] if value else []
+    unknown = set(names) - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid {param}: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}"
+        )
+    return list(dict.fromkeys(names))
+
+def _percentiles(value):
+    if value is None:
+        return DEFAULT_PERCENTILES
+    try:
+        fractions = tuple(float(part) for part in value.split(",") if part.strip())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be numbers between 0 and 1")
+    if any(not 0 <= fraction <= 1 for fraction in fractions):
+        raise HTTPException(status_code=400, detail="percentiles must be numbers between 0 and 1")
+    return fractions
+
+def _stats(db, source, group_by, metrics, percentiles, filters, min_score, max_score, fresh=True):
+    group_by = _names(group_by, tuple(GROUP_COLUMNS), "group_by")
+    metrics = _names(metrics, STATS_SOURCES[source].metrics, "metrics") or [STATS_SOURCES[source].score]
+    percentiles = _percentiles(percentiles)
+    filters = {name: value for name, value in filters.items() if value is not None}
+
+    rollup = None if fresh else find_rollup(group_by, metrics, percentiles, filters, min_score, max_score)
+    if rollup is not None:
+        rows = db.connection().execute(rollup_query(rollup, metrics, filters)).mappings()
+        refresh = db.get(RollupRefresh, rollup.name)
+        return {
+            "group_by": group_by,
+            "groups": stats_groups(rows, group_by, metrics, percentiles),
+            "source": rollup.name,
+            "refreshed_at": refresh.refreshed_at if refresh else None,
+        }
+
+    query = stats_query(source, group_by, metrics, percentiles, filters, min_score, max_score)
+    rows = db.connection().execute(query).mappings()
+    return {"group_by": group_by, "groups": stats_groups(rows, group_by, metrics, percentiles)}
+
+@router.get("/coffees", response_model=StatsResponse)
+@cached("coffees", StatsResponse, depends_on=STATS_SOURCES["coffees"].tables[1:] + (ROLLUP_TABLE,))
+@session_endpoint
+def coffee_stats(
+    group_by: Optional[str] = None,
+    metrics: Optional[str] = None,
+    percentiles: Optional[str] = None,
+    country: Optional[str] = None,
+    region: Optional[str] = None,
+    continent: Optional[str] = None,
+    variety: Optional[str] = None,
+    processing_method: Optional[str] = None,
+    harvest_year: Optional[int] = None,
+    quality_classification: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    fresh: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Grouped statistics (count, mean, min, max, stddev, percentiles) of coffee scores.
+    group_by takes country, region, continent, variety, processing_method, harvest_year
+    and quality_classification; metrics defaults to total_cup_points.
+    Requests a rollup covers are read from it (source and refreshed_at say which and
+    how fresh) unless fresh is set.
+    """
+    filters = {
+        "country": country, "region": region, "continent": continent, "variety": variety,
+        "processing_method": processing_method, "harvest_year": harvest_year,
+        "quality_classification": quality_classification,
+    }
+    return _stats(db, "coffees", group_by, metrics, percentiles, filters, min_score, max_score, fresh)
+
+@router.get("/cupping-scores", response_model=StatsResponse)
+@cached("cupping_scores", StatsResponse, depends_on=STATS_SOURCES["cupping_scores"].tables[1:])
+@session_endpoint
+def cupping_score_stats(
+    group_by: Optional[str] = None,
+    metrics: Optional[str] = None,
+    percentiles: Optional[str] = None,
+    country: Optional[str] = None,
+    region: Optional[str] = None,
+    continent: Optional[str] = None,
+    variety: Optional[str] = None,
+    processing_method: Optional[str] = None,
+    harvest_year: Optional[int] = None,
+    quality_classification: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Grouped statistics of cupping scores, grouped and filtered by the scored coffee's
+    dimensions; metrics defaults to total_score
+    """
+    filters = {
+        "country": country, "region": region, "continent": continent, "variety": variety,
+        "processing_method": processing_method, "harvest_year": harvest_year,
+        "quality_classification": quality_classification,
+    }
+    return _stats(db, "cupping_scores", group_by, metrics, percentiles, filters, min_score, max_score)
+
+@router.get("/rollups", response_model=List[RollupStatus])
+@session_endpoint
+def read_rollups(db: Session = Depends(get_db)):
+    """
+    When each materialized rollup was last refreshed
+    """
+    return rollup_status(db)
@@ -0,0 +1,64 @@
+import json
+import os
+from typing import Optional
+from fastapi import APIRouter, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+router = APIRouter()
+
+# Seconds between keepalives on an idle stream
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", 15))
+# Milliseconds an EventSource waits before reconnecting
+SSE_RETRY_MS = 1000
+
+def _sse(event):
+    if event is None:
+        return ": keepalive\n\n"
+    return f"id: {event.id}\nevent: {event.name}\ndata: {json.dumps(event.data)}\n\n"
+
+@router.get("/coffees")
+async def stream_coffees(
+    request: Request,
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-Sent Events feed of committed creates, updates and deletes of coffees and
+    cupping scores: "change" events carry table, operation and id (null for
+    set-based writes). Reconnecting with Last-Event-ID (or ?last_event_id=) replays
+    missed events, or sends a "reset" event when they are no longer available and
+    the client should reload. A client that falls too far behind is disconnected
+    and resumes the same way.
+    """
+    stream = request.app.state.change_stream
+    subscription = stream.subscribe(last_event_id_header or last_event_id)
+
+    async def body():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        async for event in stream.events(subscription, STREAM_HEARTBEAT):
+            yield _sse(event)
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/coffees/ws")
+async def stream_coffees_ws(websocket: WebSocket, last_event_id: Optional[str] = None):
+    """
+    The coffees feed over a WebSocket: one JSON message per event with its id, event
+    name and data, and {"event": "keepalive"} on an idle stream
+    """
+    stream = websocket.app.state.change_stream
+    await websocket.accept()
+    subscription = stream.subscribe(last_event_id)
+    try:
+        async for event in stream.events(subscription, STREAM_HEARTBEAT):
+            if event is None:
+                await websocket.send_json({"event": "keepalive"})
+            else:
+                await websocket.send_json({"id": event.id, "event": event.name, "data": event.data})
+        await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+from sqlalchemy.util import await_only
+from app.config.database import async_engine
+from app.models.models import Country, Producer, Coffee, CuppingScore
+from app.models.models import CountryResponse, ProducerResponse, CoffeeResponse, CuppingScoreResponse
+from app.routers.batch import with_ids
+from app.routers.rows import select_rows
+
+class IdBatcher:
+    """
+    Dataloader: ids asked for through load() during one pass of the event loop are
+    fetched together by a single fetch_many(ids) call, which returns {id: row}.
+    Ids asked for more than once in a pass are fetched once.
+    """
+    def __init__(self, fetch_many):
+        self.fetch_many = fetch_many
+        self._pending = {}
+        self._tasks = set()
+        self.loads = 0
+        self.batches = 0
+
+    async def load(self, row_id):
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+        future = loop.create_future()
+        self._pending.setdefault(row_id, []).append(future)
+        self.loads += 1
+        return await future
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        self.batches += 1
+        task = asyncio.ensure_future(self._fetch(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, pending):
+        try:
+            rows = await self.fetch_many(list(pending))
+        except Exception as error:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+            return
+        for row_id, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(rows.get(row_id))
+
+    def stats(self):
+        return {
+            "loads": self.loads,
+            "batches": self.batches,
+            "saved_queries": self.loads - self.batches,
+        }
+
+def _fetch_rows(entity, model):
+    id_column = entity.__table__.primary_key.columns[0]
+    statement = select_rows(entity, model)
+
+    async def fetch_many(ids):
+        async with async_engine.connect() as connection:
+            result = await connection.execute(statement.where(with_ids(id_column, ids)))
+            return {row[id_column.key]: SimpleNamespace(**row) for row in result.mappings()}
+    return fetch_many
+
+# One batcher per table, loading the rows of its response model
+ROW_LOADERS = {
+    "countries": IdBatcher(_fetch_rows(Country, CountryResponse)),
+    "producers": IdBatcher(_fetch_rows(Producer, ProducerResponse)),
+    "coffees": IdBatcher(_fetch_rows(Coffee, CoffeeResponse)),
+    "cupping_scores": IdBatcher(_fetch_rows(CuppingScore, CuppingScoreResponse)),
+}
+
+def load_row(table, row_id):
+    """
+    One row of table, or None, through its batcher, from a handler running under
+    AsyncSession.run_sync (session_endpoint with DB_ASYNC). Concurrent requests
+    for rows of the same table share one query and one connection.
+    """
+    return await_only(ROW_LOADERS[table].load(row_id))
+
+def batching_stats():
+    return {table: loader.stats() for table, loader in ROW_LOADERS.items()}
@@ -0,0 +1,266 @@
+import asyncio
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from fastapi import Response
+from pydantic import TypeAdapter
+from app.routers.conditional import etag_matches, not_modified
+from app.routers.rows import RowsResponse
+from app.services.events import subscribe
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 2048))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Foreign key linking each table to its parent, used to tag detail entries so that
+# deleting a parent row evicts its children
+TABLE_PARENTS = {
+    "producers": ("countries", "country_id"),
+    "coffees": ("producers", "producer_id"),
+    "cupping_scores": ("coffees", "coffee_id"),
+}
+TABLE_CHILDREN = {parent: child for child, (parent, _) in TABLE_PARENTS.items()}
+
+# Response headers kept with a cached body
+CACHED_HEADERS = ("x-next-cursor", "etag")
+
+def table_tag(table):
+    return ("table", table)
+
+def list_tag(table):
+    return ("list", table)
+
+def row_tag(table, row_id):
+    return ("row", table, row_id)
+
+def parent_tag(table, parent_id):
+    return ("parent", table, parent_id)
+
+class _Entry:
+    __slots__ = ("body", "headers", "tags", "expires_at", "size")
+
+    def __init__(self, body, headers, tags, expires_at):
+        self.body = body
+        self.headers = headers
+        self.tags = tags
+        self.expires_at = expires_at
+        self.size = len(body) + sum(len(k) + len(v) for k, v in headers.items()) + 200
+
+class ResponseCache:
+    """
+    Bounded LRU cache of serialized response bodies with a TTL and tag-based invalidation.
+
+    Every entry carries tags describing the rows it was built from; writes invalidate
+    tags rather than keys, so a change evicts exactly the entries that could contain it.
+    """
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a response computed across a write is not stored
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, body, headers, tags, version):
+        entry = _Entry(body, headers, tags, time.monotonic() + self.ttl)
+        if entry.size > self.max_bytes // 8:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self.version += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": RESPONSE_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "miss_ratio": round(self.misses / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL)
+
+def apply_change(table, operation, row_id=None):
+    """
+    Invalidate cached responses affected by an insert, update or delete on table.
+    Without a row_id, inserts drop the table's lists and other operations drop
+    every entry for the table.
+    """
+    if row_id is None:
+        if operation == "insert":
+            response_cache.invalidate(list_tag(table))
+            return
+        tags = [table_tag(table)]
+        child = TABLE_CHILDREN.get(table)
+        while operation == "delete" and child:
+            tags.append(table_tag(child))
+            child = TABLE_CHILDREN.get(child)
+        response_cache.invalidate(*tags)
+        return
+
+    tags = [list_tag(table)]
+    if operation != "insert":
+        tags.append(row_tag(table, row_id))
+    if operation == "delete":
+        # Direct children are tagged with their parent id; rows further down are
+        # not, so their tables are dropped as a whole
+        child = TABLE_CHILDREN.get(table)
+        if child:
+            tags += [parent_tag(child, row_id), list_tag(child)]
+            child = TABLE_CHILDREN.get(child)
+        while child:
+            tags.append(table_tag(child))
+            child = TABLE_CHILDREN.get(child)
+    response_cache.invalidate(*tags)
+
+@subscribe
+def _invalidate_on_change(change):
+    if change.table is None:
+        response_cache.clear()
+    else:
+        apply_change(change.table, change.operation, change.row_id)
+
+def cached(table, response_model, id_param=None, depends_on=()):
+    """
+    Cache a read handler's serialized response, keyed by the handler and its parameters.
+
+    List handlers (no id_param) are tagged for invalidation on any write to table;
+    detail handlers are tagged with their row id and their parent's id. Responses
+    built from other tables too (joins, aggregates) list them in depends_on and are
+    invalidated by any write to them.
+    Works for sync and async handlers and must wrap the function FastAPI calls.
+    RowsResponse bodies are stored as they are; other Response results bypass the cache.
+    """
+    adapter = TypeAdapter(response_model)
+    parent_column = TABLE_PARENTS.get(table, (None, None))[1]
+
+    def decorate(func):
+        if not RESPONSE_CACHE_ENABLED:
+            return func
+
+        def cache_key(kwargs):
+            return (func.__name__,) + tuple(
+                sorted((name, value) for name, value in kwargs.items() if name not in ("db", "request", "response"))
+            )
+
+        def tags_for(kwargs, result):
+            tags = [table_tag(table)]
+            for other in depends_on:
+                tags += [table_tag(other), list_tag(other)]
+            if id_param is None:
+                tags.append(list_tag(table))
+            else:
+                tags.append(row_tag(table, kwargs[id_param]))
+                if parent_column:
+                    source = result.source if isinstance(result, RowsResponse) else result
+                    tags.append(parent_tag(table, getattr(source, parent_column)))
+            return tags
+
+        def hit_response(entry, kwargs):
+            etag = entry.headers.get("etag")
+            if etag and etag_matches(kwargs.get("request"), etag):
+                return not_modified(etag)
+            return Response(content=entry.body, media_type="application/json", headers=entry.headers)
+
+        def store(key, kwargs, result, version):
+            if isinstance(result, RowsResponse):
+                body = result.body
+            elif isinstance(result, Response):
+                return result
+            else:
+                body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+            response = kwargs.get("response")
+            headers = {}
+            if response is not None:
+                headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+            response_cache.set(key, body, headers, tags_for(kwargs, result), version)
+            return Response(content=body, media_type="application/json", headers=headers)
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def endpoint(*args, **kwargs):
+                key = cache_key(kwargs)
+                entry = response_cache.get(key)
+                if entry is not None:
+                    return hit_response(entry, kwargs)
+                version = response_cache.version
+                return store(key, kwargs, await func(*args, **kwargs), version)
+        else:
+            @wraps(func)
+            def endpoint(*args, **kwargs):
+                key = cache_key(kwargs)
+                entry = response_cache.get(key)
+                if entry is not None:
+                    return hit_response(entry, kwargs)
+                version = response_cache.version
+                return store(key, kwargs, func(*args, **kwargs), version)
+
+        endpoint.__signature__ = inspect.signature(func)
+        return endpoint
+    return decorate
@@ -0,0 +1,164 @@
+"""
+Changes feed: rows inserted, updated or deleted since a change token.
+
+Triggers stamp every inserted or updated row of the synced tables with the id
+of the writing transaction (change_xid) and record deleted rows as tombstones
+with theirs. A token covers the transactions with an id below the xmin of the
+snapshot it was issued from: all of them had finished, so none can still commit
+behind the token. Sequence numbers or timestamps, taken before commit, could.
+Reading the changes since a token therefore scans only the change_xid indexes
+from that point on, and a row changed several times appears once, as it is now.
+"""
+import base64
+import json
+import os
+from collections import namedtuple
+from sqlalchemy import select, text, tuple_
+from app.models.models import Country, Producer, Coffee, CuppingScore, Tombstone
+from app.models.models import CountryResponse, ProducerResponse, CoffeeResponse, CuppingScoreResponse
+from app.routers.rows import select_rows
+
+DEFAULT_CHANGES_LIMIT = 1000
+# Largest limit a changes request accepts; each synced table is read up to limit + 1 rows
+MAX_CHANGES_LIMIT = int(os.getenv("MAX_CHANGES_LIMIT", 5000))
+
+# A synced table; rank orders changes of the same transaction across tables
+ChangeSource = namedtuple("ChangeSource", ["table", "entity", "model", "rank"])
+
+CHANGE_SOURCES = (
+    ChangeSource("countries", Country, CountryResponse, 0),
+    ChangeSource("producers", Producer, ProducerResponse, 1),
+    ChangeSource("coffees", Coffee, CoffeeResponse, 2),
+    ChangeSource("cupping_scores", CuppingScore, CuppingScoreResponse, 3),
+)
+TOMBSTONE_RANK = len(CHANGE_SOURCES)
+
+_XACT_ID = "pg_current_xact_id()::text::bigint"
+
+def create_change_tracking(connection):
+    """
+    Create or replace the trigger functions maintaining change_xid and the
+    tombstones, and attach them to the tables missing their triggers. Existing
+    triggers are left alone: creating one locks its table.
+    """
+    connection.execute(text(f"""
+        CREATE OR REPLACE FUNCTION stamp_change_xid() RETURNS trigger AS $$
+        BEGIN
+            NEW.change_xid := {_XACT_ID};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    connection.execute(text(f"""
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO tombstones (table_name, row_id, change_xid)
+            VALUES (TG_TABLE_NAME, (to_jsonb(OLD) ->> TG_ARGV[0])::integer, {_XACT_ID});
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    existing = set(connection.execute(text(
+        "SELECT c.relname, t.tgname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid "
+        "WHERE NOT t.tgisinternal AND c.relnamespace = current_schema()::regnamespace"
+    )).all())
+    for source in CHANGE_SOURCES:
+        id_column = source.entity.__table__.primary_key.columns[0].name
+        if (source.table, f"{source.table}_change_xid") not in existing:
+            connection.execute(text(
+                f"CREATE TRIGGER {source.table}_change_xid BEFORE INSERT OR UPDATE ON {source.table} "
+                f"FOR EACH ROW EXECUTE FUNCTION stamp_change_xid()"
+            ))
+        if (source.table, f"{source.table}_tombstone") not in existing:
+            connection.execute(text(
+                f"CREATE TRIGGER {source.table}_tombstone AFTER DELETE ON {source.table} "
+                f"FOR EACH ROW EXECUTE FUNCTION record_tombstone('{id_column}')"
+            ))
+
+def encode_token(low, high=None, position=None):
+    payload = json.dumps([low, high, position], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_token(token):
+    """
+    (low, high, position) of a token: the first transaction id it covers and, for a
+    page in the middle of a window, the window's end and the last change returned
+    """
+    padded = token + "=" * (-len(token) % 4)
+    low, high, position = json.loads(base64.urlsafe_b64decode(padded))
+    low = int(low)
+    if high is not None:
+        high = int(high)
+        position = tuple(int(part) for part in position)
+    return low, high, position
+
+def current_horizon(db):
+    """
+    xmin of the current snapshot: every transaction with a lower id has finished
+    """
+    return db.scalar(select(text("pg_snapshot_xmin(pg_current_snapshot())::text::bigint")))
+
+def _after(change_xid, id_column, rank, position):
+    # Changes come in (change_xid, rank, id) order; this selects those after position
+    if position is None:
+        return None
+    after_xid, after_rank, after_id = position
+    if rank > after_rank:
+        return change_xid >= after_xid
+    if rank < after_rank:
+        return change_xid > after_xid
+    return tuple_(change_xid, id_column) > (after_xid, after_id)
+
+def _window(statement, change_xid, id_column, rank, low, high, position, limit):
+    statement = statement.where(change_xid >= low, change_xid < high)
+    after = _after(change_xid, id_column, rank, position)
+    if after is not None:
+        statement = statement.where(after)
+    return statement.order_by(change_xid, id_column).limit(limit + 1)
+
+def changes_since(db, token=None, limit=DEFAULT_CHANGES_LIMIT):
+    """
+    Up to limit changes after token, oldest first, with the token to continue from.
+    Without a token nothing is returned, only the token to sync from after a full
+    download taken from now on.
+    """
+    horizon = current_horizon(db)
+    if token is None:
+        return {"changes": [], "next": encode_token(horizon), "has_more": False}
+    low, high, position = decode_token(token)
+    high = high if high is not None else horizon
+
+    changes = []
+    connection = db.connection()
+    for source in CHANGE_SOURCES:
+        table = source.entity.__table__
+        id_column = table.primary_key.columns[0]
+        statement = _window(
+            select_rows(source.entity, source.model).add_columns(table.c.change_xid.label("_change_xid")),
+            table.c.change_xid, id_column, source.rank, low, high, position, limit
+        )
+        for row in connection.execute(statement).mappings():
+            row = dict(row)
+            change_xid = row.pop("_change_xid")
+            changes.append(((change_xid, source.rank, row[id_column.key]), {
+                "table": source.table, "operation": "upsert", "id": row[id_column.key], "row": row,
+            }))
+
+    statement = _window(
+        select(Tombstone.tombstone_id, Tombstone.table_name, Tombstone.row_id, Tombstone.change_xid),
+        Tombstone.change_xid, Tombstone.tombstone_id, TOMBSTONE_RANK, low, high, position, limit
+    )
+    for tombstone in connection.execute(statement):
+        changes.append(((tombstone.change_xid, TOMBSTONE_RANK, tombstone.tombstone_id), {
+            "table": tombstone.table_name, "operation": "delete", "id": tombstone.row_id, "row": None,
+        }))
+
+    changes.sort(key=lambda change: change[0])
+    if len(changes) > limit:
+        changes = changes[:limit]
+        return {
+            "changes": [change for _, change in changes],
+            "next": encode_token(low, high, list(changes[-1][0])),
+            "has_more": True,
+        }
+    return {"changes": [change for _, change in changes], "next": encode_token(high), "has_more": False}
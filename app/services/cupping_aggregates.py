@@ -0,0 +1,168 @@
+import math
+from collections.abc import Mapping
+from sqlalchemy import Float, Integer, bindparam, case, delete, exists, func, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert
+from app.models.models import CuppingAggregate, CuppingScore
+from app.services.scoring import CUPPING_SCORE_FIELDS
+
+# Attributes with a running aggregate per coffee
+AGGREGATE_FIELDS = CUPPING_SCORE_FIELDS + ("total_score",)
+
+# Transaction advisory lock taken by the backfill, so two workers starting on an
+# empty table do not both rebuild it and clash on its primary key
+BACKFILL_LOCK_KEY = 0x63757070
+
+def snapshot(record):
+    """
+    The coffee_id and aggregated attributes of a cupping score (mapping or object),
+    taken before an update changes them
+    """
+    get = record.get if isinstance(record, Mapping) else lambda name: getattr(record, name)
+    return {name: get(name) for name in ("coffee_id",) + AGGREGATE_FIELDS}
+
+def partial_aggregates(records):
+    """
+    count, mean and m2 per (coffee_id, attribute) over records, the deltas merged
+    into or removed from cupping_aggregates
+    """
+    values = {}
+    for record in map(snapshot, records):
+        if record["coffee_id"] is None:
+            continue
+        for attribute in AGGREGATE_FIELDS:
+            if record[attribute] is not None:
+                values.setdefault((record["coffee_id"], attribute), []).append(record[attribute])
+
+    partials = []
+    for (coffee_id, attribute), observed in values.items():
+        mean = sum(observed) / len(observed)
+        partials.append({
+            "coffee_id": coffee_id,
+            "attribute": attribute,
+            "count": len(observed),
+            "mean": mean,
+            "m2": sum((value - mean) ** 2 for value in observed),
+        })
+    return partials
+
+def add_observations(db, records):
+    """
+    Merge records into their coffees' aggregates with one upsert, using the parallel
+    form of Welford's update
+    """
+    partials = partial_aggregates(records)
+    if not partials:
+        return
+    table = CuppingAggregate.__table__
+    statement = insert(table).values(partials)
+    new = statement.excluded
+    count = table.c.count + new.count
+    delta = new.mean - table.c.mean
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[table.c.coffee_id, table.c.attribute],
+        set_={
+            "count": count,
+            "mean": table.c.mean + delta * new.count / count,
+            "m2": table.c.m2 + new.m2 + delta * delta * table.c.count * new.count / count,
+        },
+    ))
+
+def remove_observations(db, records):
+    """
+    Take records back out of their coffees' aggregates (inverse of add_observations)
+    """
+    partials = partial_aggregates(records)
+    if not partials:
+        return
+    table = CuppingAggregate.__table__
+    removed_count = bindparam("removed_count", type_=Integer)
+    removed_mean = bindparam("removed_mean", type_=Float)
+    removed_m2 = bindparam("removed_m2", type_=Float)
+    count = table.c.count - removed_count
+    delta = removed_mean - table.c.mean
+    statement = (
+        update(table)
+        .where(table.c.coffee_id == bindparam("key_coffee_id"), table.c.attribute == bindparam("key_attribute"))
+        .values(
+            count=count,
+            mean=case((count > 0, (table.c.mean * table.c.count - removed_mean * removed_count) / count), else_=0.0),
+            m2=case(
+                (count > 1, func.greatest(
+                    table.c.m2 - removed_m2 - delta * delta * table.c.count * removed_count / count, 0.0
+                )),
+                else_=0.0,
+            ),
+        )
+    )
+    db.connection().execute(statement, [
+        {
+            "key_coffee_id": partial["coffee_id"],
+            "key_attribute": partial["attribute"],
+            "removed_count": partial["count"],
+            "removed_mean": partial["mean"],
+            "removed_m2": partial["m2"],
+        }
+        for partial in partials
+    ])
+
+def update_observations(db, previous, record):
+    """
+    Replace a cupping score's previous snapshot with its current values, if they changed
+    """
+    if snapshot(record) != previous:
+        remove_observations(db, [previous])
+        add_observations(db, [record])
+
+def rebuild_aggregates(db, coffee_ids=None):
+    """
+    Recompute aggregates from the cupping scores, for every coffee or those selected
+    by coffee_ids. A full scan, for backfills and bulk rescoring only.
+    """
+    table = CuppingAggregate.__table__
+    wipe = delete(table)
+    selects = []
+    for attribute in AGGREGATE_FIELDS:
+        column = getattr(CuppingScore, attribute)
+        query = (
+            select(
+                CuppingScore.coffee_id,
+                literal(attribute),
+                func.count(column),
+                func.avg(column),
+                func.var_pop(column) * func.count(column),
+            )
+            .where(CuppingScore.coffee_id.is_not(None), column.is_not(None))
+            .group_by(CuppingScore.coffee_id)
+        )
+        if coffee_ids is not None:
+            query = query.where(CuppingScore.coffee_id.in_(coffee_ids))
+        selects.append(query)
+    if coffee_ids is not None:
+        wipe = wipe.where(table.c.coffee_id.in_(coffee_ids))
+    db.execute(wipe)
+    db.execute(insert(table).from_select(["coffee_id", "attribute", "count", "mean", "m2"], union_all(*selects)))
+
+def backfill_aggregates(connection):
+    """
+    Build the aggregates of existing cupping scores when the table is still empty.
+    The lock is held until the caller's transaction ends, so a worker waiting on it
+    sees the rows the first one committed and skips the rebuild.
+    """
+    connection.execute(select(func.pg_advisory_xact_lock(BACKFILL_LOCK_KEY)))
+    if not connection.scalar(select(exists().select_from(CuppingAggregate.__table__))):
+        rebuild_aggregates(connection)
+
+def cupping_summary(db, coffee_id):
+    """
+    Count, mean, sample variance and stddev per attribute from a coffee's aggregates
+    """
+    attributes = {}
+    for aggregate in db.query(CuppingAggregate).filter(CuppingAggregate.coffee_id == coffee_id):
+        variance = aggregate.m2 / (aggregate.count - 1) if aggregate.count > 1 else None
+        attributes[aggregate.attribute] = {
+            "count": aggregate.count,
+            "mean": aggregate.mean if aggregate.count else None,
+            "variance": variance,
+            "stddev": math.sqrt(variance) if variance is not None else None,
+        }
+    return {"coffee_id": coffee_id, "attributes": attributes}
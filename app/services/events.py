@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import namedtuple
+import asyncpg
+from sqlalchemy import event, select, func
+from sqlalchemy.orm import Session
+from app.config.database import POSTGRES_URI
+
+logger = logging.getLogger(__name__)
+
+DB_NOTIFY_ENABLED = os.getenv("DB_NOTIFY_ENABLED", "true").lower() in ("1", "true", "yes")
+# LISTEN needs a session-level connection; point this at a direct (non-pooler) host
+# when DB_URI goes through a transaction-mode connection pooler
+DB_LISTEN_URI = os.getenv("DB_LISTEN_URI", POSTGRES_URI)
+CHANGE_CHANNEL = "table_changes"
+
+# Identifies this process so it can skip the notifications it published itself
+ORIGIN = uuid.uuid4().hex[:12]
+
+# A committed write: operation is insert, update or delete. row_id is None for
+# set-based writes; table is None for a reset (events may have been missed).
+Change = namedtuple("Change", ["table", "operation", "row_id", "origin"])
+
+_PENDING_KEY = "pending_changes"
+_subscribers = []
+
+def subscribe(callback):
+    """
+    Call callback(change) for every committed change, local or from another worker
+    """
+    _subscribers.append(callback)
+    return callback
+
+def unsubscribe(callback):
+    if callback in _subscribers:
+        _subscribers.remove(callback)
+
+def dispatch(change):
+    for callback in list(_subscribers):
+        try:
+            callback(change)
+        except Exception:
+            logger.exception("Change subscriber failed for %s", change)
+
+def record_change(db, table, operation, row_id=None):
+    """
+    Queue a change event on the session. It is published with NOTIFY inside the
+    transaction when it commits, and discarded if the transaction rolls back.
+    """
+    db.info.setdefault(_PENDING_KEY, []).append(Change(table, operation, row_id, ORIGIN))
+
+@event.listens_for(Session, "before_commit")
+def _publish_pending(session):
+    changes = session.info.get(_PENDING_KEY)
+    if not changes or not DB_NOTIFY_ENABLED:
+        return
+    payloads = [
+        json.dumps([change.table, change.operation, change.row_id, change.origin])
+        for change in changes
+    ]
+    session.execute(select(*[func.pg_notify(CHANGE_CHANNEL, payload) for payload in payloads]))
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending(session):
+    for change in session.info.pop(_PENDING_KEY, ()):
+        dispatch(change)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+class ChangeListener:
+    """
+    Keeps a LISTEN connection open and dispatches changes published by other workers.
+    Reconnects with backoff and dispatches a reset on every (re)connect, since
+    notifications sent while disconnected are lost.
+    """
+    def __init__(self, dsn=DB_LISTEN_URI, channel=CHANGE_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.connected = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            table, operation, row_id, origin = json.loads(payload)
+        except (ValueError, TypeError):
+            logger.warning("Ignoring malformed change notification: %s", payload)
+            return
+        if origin != ORIGIN:
+            dispatch(Change(table, operation, row_id, origin))
+
+    async def _run(self):
+        delay = 0.5
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self._on_notification)
+                dispatch(Change(None, "reset", None, ORIGIN))
+                delay = 0.5
+                self.connected.set()
+                while not connection.is_closed():
+                    await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change listener connection failed, retrying in %.1fs", delay)
+            finally:
+                self.connected.clear()
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from sqlalchemy import select
+from app.config.database import engine, async_engine
+from app.models.models import Country, Producer, Coffee
+
+# Rows fetched from the server-side cursor and written per chunk
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_INCLUDES = ("producer", "country")
+
+PRODUCER_EXPORT_COLUMNS = ("company_name", "farm_name", "mill", "altitude_mean_meters")
+COUNTRY_EXPORT_COLUMNS = ("country_name", "region", "continent")
+
+def coffee_export_query(include=(), producer_id=None, min_score=None, quality_classification=None):
+    """
+    Core select of the coffee columns, optionally joined with producer and country
+    columns prefixed with producer_/country_
+    """
+    # change_xid is bookkeeping for the changes feed, not coffee data
+    columns = [column for column in Coffee.__table__.columns if column.key != "change_xid"]
+    if "producer" in include or "country" in include:
+        columns += [getattr(Producer, name).label(f"producer_{name}") for name in PRODUCER_EXPORT_COLUMNS]
+    if "country" in include:
+        columns += [getattr(Country, name).label(f"country_{name}") for name in COUNTRY_EXPORT_COLUMNS]
+
+    query = select(*columns)
+    if "producer" in include or "country" in include:
+        query = query.outerjoin(Producer, Producer.producer_id == Coffee.producer_id)
+    if "country" in include:
+        query = query.outerjoin(Country, Country.country_id == Producer.country_id)
+
+    if producer_id:
+        query = query.where(Coffee.producer_id == producer_id)
+    if min_score:
+        query = query.where(Coffee.total_cup_points >= min_score)
+    if quality_classification:
+        query = query.where(Coffee.quality_classification == quality_classification)
+    return query.order_by(Coffee.coffee_id)
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class _Encoder:
+    """
+    Turns batches of result rows into NDJSON or CSV text
+    """
+    def __init__(self, fmt, keys):
+        self.fmt = fmt
+        self.keys = list(keys)
+
+    def header(self):
+        return self._csv([self.keys])
+
+    def encode(self, rows):
+        if self.fmt == "csv":
+            return self._csv(rows)
+        return "".join(
+            json.dumps(dict(zip(self.keys, row)), default=_json_default) + "\n" for row in rows
+        )
+
+    @staticmethod
+    def _csv(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+def stream_export(query, fmt):
+    """
+    Yield the export in chunks from a server-side cursor on the sync engine
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        ).execute(query)
+        encoder = _Encoder(fmt, result.keys())
+        if fmt == "csv":
+            yield encoder.header()
+        for rows in result.partitions():
+            yield encoder.encode(rows)
+
+async def stream_export_async(query, fmt):
+    """
+    Yield the export in chunks from a server-side cursor on the async engine
+    """
+    async with async_engine.connect() as connection:
+        result = await connection.stream(query)
+        encoder = _Encoder(fmt, result.keys())
+        if fmt == "csv":
+            yield encoder.header()
+        async for rows in result.partitions(EXPORT_BATCH_SIZE):
+            yield encoder.encode(rows)
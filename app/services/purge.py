@@ -0,0 +1,150 @@
+"""
+Delete a country, producer or coffee and everything below it in batches.
+
+A single DELETE lets the foreign keys cascade in one statement, which holds its
+locks and grows the transaction with the whole subtree. For very large subtrees
+this job deletes the descendants bottom-up instead, one batch per transaction,
+and stores its progress in job_progress (last_id counts the rows deleted so far
+and target_id the rows counted when it started). The root row goes last, so an
+interrupted run leaves a smaller subtree that a new run finishes. Cupping scores
+are taken out of their coffees' aggregates in the transaction deleting them.
+"""
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from app.config.database import SessionLocal
+from app.models.models import Country, Producer, Coffee, CuppingScore, JobProgress
+from app.services.cupping_aggregates import AGGREGATE_FIELDS, remove_observations
+from app.services.events import record_change
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Table a delete starts from: (entity, primary key)
+ROOTS = {
+    "countries": (Country, Country.country_id),
+    "producers": (Producer, Producer.producer_id),
+    "coffees": (Coffee, Coffee.coffee_id),
+}
+
+# Parent foreign key of each table below a root
+PARENT_KEYS = {
+    "producers": (Producer, Producer.producer_id, Producer.country_id),
+    "coffees": (Coffee, Coffee.coffee_id, Coffee.producer_id),
+    "cupping_scores": (CuppingScore, CuppingScore.score_id, CuppingScore.coffee_id),
+}
+CHILD_TABLES = {"countries": "producers", "producers": "coffees", "coffees": "cupping_scores"}
+
+# Jobs running in this process, so the same subtree is not deleted twice at once
+_running = set()
+_running_lock = threading.Lock()
+
+def job_name(table, row_id):
+    return f"delete_{table}_{row_id}"
+
+def _levels(table, row_id):
+    """
+    (entity, primary key, select of its ids under the root) for every table below
+    table, deepest first
+    """
+    levels = []
+    ids = select(ROOTS[table][1]).where(ROOTS[table][1] == row_id)
+    child = CHILD_TABLES.get(table)
+    while child:
+        entity, id_column, parent_column = PARENT_KEYS[child]
+        ids = select(id_column).where(parent_column.in_(ids))
+        levels.append((entity, id_column, ids))
+        child = CHILD_TABLES.get(child)
+    return levels[::-1]
+
+def claim(table, row_id):
+    """
+    Reserve the job for a subtree; False if it is already being deleted
+    """
+    with _running_lock:
+        name = job_name(table, row_id)
+        if name in _running:
+            return False
+        _running.add(name)
+        return True
+
+def run_purge(table, row_id, batch_size=DEFAULT_BATCH_SIZE, progress=None, session_factory=SessionLocal):
+    """
+    Delete a row and its descendants batch by batch, calling progress(job) after
+    each batch. The job must have been claimed.
+    """
+    entity, id_column = ROOTS[table]
+    levels = _levels(table, row_id)
+    name = job_name(table, row_id)
+
+    try:
+        with session_factory() as db:
+            job = db.get(JobProgress, name) or JobProgress(job_name=name)
+            db.add(job)
+            job.status = "running"
+            job.last_id = 0
+            job.rows_changed = 0
+            job.error = None
+            job.started_at = datetime.utcnow()
+            job.finished_at = None
+            job.target_id = 1 + sum(
+                db.scalar(select(func.count()).select_from(ids.subquery())) for _, _, ids in levels
+            )
+            db.commit()
+            try:
+                for level, level_id, ids in levels:
+                    while True:
+                        statement = (
+                            delete(level)
+                            .where(level_id.in_(ids.limit(batch_size).scalar_subquery()))
+                            .execution_options(synchronize_session=False)
+                        )
+                        if level is CuppingScore:
+                            removed = db.execute(statement.returning(
+                                CuppingScore.coffee_id, *[getattr(CuppingScore, name) for name in AGGREGATE_FIELDS]
+                            )).mappings().all()
+                            remove_observations(db, removed)
+                            rowcount = len(removed)
+                        else:
+                            rowcount = db.execute(statement).rowcount
+                        if not rowcount:
+                            break
+                        job.last_id += rowcount
+                        job.rows_changed += rowcount
+                        record_change(db, level.__tablename__, "delete")
+                        db.commit()
+                        if progress:
+                            progress(job)
+
+                deleted = db.execute(
+                    delete(entity).where(id_column == row_id).returning(id_column)
+                    .execution_options(synchronize_session=False)
+                ).scalar()
+                if deleted is not None:
+                    job.last_id += 1
+                    job.rows_changed += 1
+                    record_change(db, table, "delete", row_id)
+                job.status = "finished"
+                job.finished_at = datetime.utcnow()
+                db.commit()
+            except Exception as error:
+                db.rollback()
+                job.status = "failed"
+                job.error = str(error)
+                db.commit()
+                raise
+            db.refresh(job)
+            if progress:
+                progress(job)
+            db.expunge(job)
+        return job
+    finally:
+        with _running_lock:
+            _running.discard(name)
+
+def log_progress(job):
+    logger.info(
+        "%s: %s%% (%s of %s rows deleted)", job.job_name, job.percent_complete, job.last_id, job.target_id
+    )
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Recompute the derived score columns with chunked set-based UPDATEs.
+
+coffees.total_cup_points/quality_classification and cupping_scores.total_score are
+only written by the create/update endpoints, so rows loaded another way or scored
+under old thresholds keep stale values. This job walks each table in primary key
+order, updates one chunk per transaction and stores its position in job_progress
+with the same commit, so an interrupted run resumes where it stopped.
+
+    python -m app.services.recompute [--chunk-size 5000] [--restart]
+"""
+import argparse
+import logging
+from datetime import datetime
+from sqlalchemy import select, update, func, or_
+from app.config.database import SessionLocal, engine
+from app.models.models import Coffee, CuppingScore, JobProgress
+from app.services.cupping_aggregates import rebuild_aggregates
+from app.services.events import record_change
+from app.services.scoring import coffee_total_sql, cupping_total_sql, classify_sql
+
+logger = logging.getLogger(__name__)
+
+COFFEE_JOB = "recompute_coffee_scores"
+CUPPING_JOB = "recompute_cupping_scores"
+DEFAULT_CHUNK_SIZE = 5000
+
+# Session advisory lock held for a whole recompute, across its chunk transactions,
+# so two workers never run one at once
+RECOMPUTE_LOCK_KEY = 0x7265636F
+
+def _coffee_changes():
+    total = coffee_total_sql(Coffee)
+    classification = classify_sql(total)
+    changed = or_(
+        Coffee.total_cup_points.is_distinct_from(total),
+        Coffee.quality_classification.is_distinct_from(classification),
+    )
+    return total, changed, {"total_cup_points": total, "quality_classification": classification}
+
+def _cupping_changes():
+    total = cupping_total_sql(CuppingScore)
+    return total, CuppingScore.total_score.is_distinct_from(total), {"total_score": total}
+
+def _rebuild_cupping_aggregates(db, chunk):
+    # Bulk rescoring bypasses the endpoints' incremental updates, so the chunk's
+    # coffees get their aggregates rebuilt in the same transaction
+    rebuild_aggregates(db, select(CuppingScore.coffee_id).where(chunk).distinct())
+
+# job name: (entity, primary key, changes, hook run in a chunk's transaction after it changed rows)
+JOBS = {
+    COFFEE_JOB: (Coffee, Coffee.coffee_id, _coffee_changes, None),
+    CUPPING_JOB: (CuppingScore, CuppingScore.score_id, _cupping_changes, _rebuild_cupping_aggregates),
+}
+
+def _start(db, job_name, id_column, restart):
+    """
+    Load the job's checkpoint, or start a new run if there is none, the last run
+    finished, or restart was requested
+    """
+    job = db.get(JobProgress, job_name)
+    if job is None:
+        job = JobProgress(job_name=job_name)
+        db.add(job)
+    elif job.status != "finished" and not restart:
+        logger.info("Resuming %s after id %s", job_name, job.last_id)
+        job.status = "running"
+        job.error = None
+        db.commit()
+        return job
+
+    job.status = "running"
+    job.last_id = 0
+    job.rows_changed = 0
+    job.error = None
+    job.started_at = datetime.utcnow()
+    job.finished_at = None
+    job.target_id = db.scalar(select(func.max(id_column)))
+    db.commit()
+    return job
+
+def run_job(job_name, chunk_size=DEFAULT_CHUNK_SIZE, restart=False, progress=None, session_factory=SessionLocal):
+    """
+    Run one recompute job to completion, calling progress(job) after each chunk
+    """
+    entity, id_column, changes, after_chunk = JOBS[job_name]
+    total, changed, values = changes()
+
+    with session_factory() as db:
+        job = _start(db, job_name, id_column, restart)
+        try:
+            while True:
+                # Upper bound of the next chunk, found with an index seek on the primary key
+                upper = db.scalar(
+                    select(id_column).where(id_column > job.last_id)
+                    .order_by(id_column).offset(chunk_size - 1).limit(1)
+                )
+                if upper is None:
+                    upper = db.scalar(select(func.max(id_column)).where(id_column > job.last_id))
+                if upper is None:
+                    break
+
+                chunk = (id_column > job.last_id) & (id_column <= upper)
+                result = db.execute(
+                    update(entity)
+                    .where(chunk, total.is_not(None), changed)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                job.last_id = upper
+                job.rows_changed += result.rowcount
+                if result.rowcount:
+                    if after_chunk:
+                        after_chunk(db, chunk)
+                    record_change(db, entity.__tablename__, "update")
+                db.commit()
+                if progress:
+                    progress(job)
+
+            job.status = "finished"
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        except Exception as error:
+            db.rollback()
+            job.status = "failed"
+            job.error = str(error)
+            db.commit()
+            raise
+        db.refresh(job)
+        if progress:
+            progress(job)
+        db.expunge(job)
+    return job
+
+def acquire_recompute_lock(bind=engine):
+    """
+    A connection holding the recompute lock, or None if another recompute holds it
+    """
+    connection = bind.connect()
+    try:
+        acquired = connection.execute(select(func.pg_try_advisory_lock(RECOMPUTE_LOCK_KEY))).scalar()
+        connection.commit()
+    except Exception:
+        connection.close()
+        raise
+    if not acquired:
+        connection.close()
+        return None
+    return connection
+
+def release_recompute_lock(connection):
+    """
+    Release the lock taken by acquire_recompute_lock; closing alone would return
+    the connection to the pool still holding it
+    """
+    try:
+        connection.execute(select(func.pg_advisory_unlock(RECOMPUTE_LOCK_KEY)))
+        connection.commit()
+    finally:
+        connection.close()
+
+def run_all(chunk_size=DEFAULT_CHUNK_SIZE, restart=False, progress=None, lock=None, jobs=JOBS):
+    """
+    Recompute coffees and cupping scores, one job after the other, holding the
+    recompute lock. lock is one already taken with acquire_recompute_lock, released
+    when the jobs end.
+    """
+    if lock is None:
+        lock = acquire_recompute_lock()
+        if lock is None:
+            raise RuntimeError("Score recompute already running")
+    try:
+        return [run_job(job_name, chunk_size, restart, progress) for job_name in jobs]
+    finally:
+        release_recompute_lock(lock)
+
+def log_progress(job):
+    logger.info(
+        "%s: %s%% (last id %s of %s, %s rows changed)",
+        job.job_name, job.percent_complete, job.last_id, job.target_id, job.rows_changed
+    )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Recompute derived score columns")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore checkpoints and start from the first row")
+    parser.add_argument("--job", choices=sorted(JOBS), help="run only this job")
+    args = parser.parse_args()
+
+    from app.models.schema import upgrade_schema
+    upgrade_schema(engine)
+    run_all(args.chunk_size, args.restart, log_progress, jobs=[args.job] if args.job else JOBS)
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import column, func, select, table, text
+from sqlalchemy.dialects import postgresql
+from app.config.database import SessionLocal
+from app.models.models import RollupRefresh
+from app.services.events import record_change, subscribe, unsubscribe
+from app.services.scoring import COFFEE_SCORE_FIELDS
+from app.services.stats import DEFAULT_PERCENTILES, STATS_SOURCES, stats_query
+
+logger = logging.getLogger(__name__)
+
+# Refresh every ROLLUP_REFRESH_INTERVAL seconds if anything changed (0 disables),
+# or as soon as ROLLUP_REFRESH_AFTER_WRITES changes have been committed (0 disables)
+ROLLUP_REFRESH_INTERVAL = float(os.getenv("ROLLUP_REFRESH_INTERVAL", 300))
+ROLLUP_REFRESH_AFTER_WRITES = int(os.getenv("ROLLUP_REFRESH_AFTER_WRITES", 1000))
+
+ROLLUP_METRICS = ("total_cup_points",) + COFFEE_SCORE_FIELDS
+# Change event table name published after a refresh, so cached stats are evicted
+ROLLUP_TABLE = "rollups"
+# Transaction advisory lock taken by the refresh, so workers never refresh at once
+ROLLUP_LOCK_KEY = 0x726F6C6C
+ROLLUP_SOURCE_TABLES = set(STATS_SOURCES["coffees"].tables)
+
+# A materialized view of the coffee stats grouped by one dimension
+Rollup = namedtuple("Rollup", ["name", "dimension"])
+
+ROLLUPS = (
+    Rollup("coffee_stats_by_country", "country"),
+    Rollup("coffee_stats_by_variety", "variety"),
+    Rollup("coffee_stats_by_harvest_year", "harvest_year"),
+)
+ROLLUPS_BY_DIMENSION = {rollup.dimension: rollup for rollup in ROLLUPS}
+
+def rollup_definition(rollup):
+    """
+    The view's SELECT: the live stats query for its dimension, so view columns
+    carry the same labels stats_groups reads
+    """
+    query = stats_query("coffees", [rollup.dimension], ROLLUP_METRICS, DEFAULT_PERCENTILES)
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+def create_rollups(connection):
+    """
+    Create missing rollup views with the unique index REFRESH ... CONCURRENTLY needs.
+    A new view is populated on creation, which counts as its first refresh.
+    """
+    for rollup in ROLLUPS:
+        connection.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup.name} AS {rollup_definition(rollup)}"))
+        connection.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{rollup.name}_{rollup.dimension} ON {rollup.name} ({rollup.dimension})"
+        ))
+        connection.execute(
+            postgresql.insert(RollupRefresh)
+            .values(name=rollup.name, refreshed_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+
+def find_rollup(group_by, metrics, percentiles, filters, min_score=None, max_score=None):
+    """
+    The rollup that can answer a stats request, or None if it needs the live query
+    """
+    if len(group_by) != 1 or min_score is not None or max_score is not None:
+        return None
+    rollup = ROLLUPS_BY_DIMENSION.get(group_by[0])
+    if rollup is None or tuple(percentiles) != DEFAULT_PERCENTILES:
+        return None
+    if not set(metrics) <= set(ROLLUP_METRICS) or set(filters) - {rollup.dimension}:
+        return None
+    return rollup
+
+def rollup_query(rollup, metrics, filters):
+    """
+    Select the stats columns of metrics from a rollup view
+    """
+    names = [rollup.dimension, "count"]
+    for name in metrics:
+        names += [f"{name}__{stat}" for stat in ("count", "mean", "min", "max", "stddev", "percentiles")]
+    view = table(rollup.name, *[column(name) for name in names])
+    query = select(*view.c)
+    if rollup.dimension in filters:
+        query = query.where(view.c[rollup.dimension] == filters[rollup.dimension])
+    return query.order_by(view.c[rollup.dimension])
+
+def refresh_rollups(session_factory=SessionLocal):
+    """
+    REFRESH MATERIALIZED VIEW CONCURRENTLY every rollup, so readers are not blocked,
+    and record when each was refreshed. Returns False if another worker is refreshing.
+    """
+    with session_factory() as db:
+        if not db.execute(select(func.pg_try_advisory_xact_lock(ROLLUP_LOCK_KEY))).scalar():
+            return False
+        for rollup in ROLLUPS:
+            start = time.perf_counter()
+            db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {rollup.name}"))
+            db.merge(RollupRefresh(
+                name=rollup.name,
+                refreshed_at=datetime.utcnow(),
+                duration_ms=round((time.perf_counter() - start) * 1000, 1)
+            ))
+        record_change(db, ROLLUP_TABLE, "refresh")
+        db.commit()
+    return True
+
+def rollup_status(db):
+    """
+    Freshness of every rollup: when it was last refreshed and how long ago
+    """
+    refreshes = {refresh.name: refresh for refresh in db.query(RollupRefresh)}
+    now = datetime.utcnow()
+    status = []
+    for rollup in ROLLUPS:
+        refresh = refreshes.get(rollup.name)
+        status.append({
+            "name": rollup.name,
+            "group_by": rollup.dimension,
+            "refreshed_at": refresh.refreshed_at if refresh else None,
+            "age_seconds": round((now - refresh.refreshed_at).total_seconds(), 1) if refresh else None,
+            "duration_ms": refresh.duration_ms if refresh else None,
+        })
+    return status
+
+class RollupRefresher:
+    """
+    Refreshes the rollups in the background after enough committed writes to their
+    source tables, or on the interval when anything changed since the last refresh
+    """
+    def __init__(self, interval=ROLLUP_REFRESH_INTERVAL, after_writes=ROLLUP_REFRESH_AFTER_WRITES):
+        self.interval = interval or None
+        self.after_writes = after_writes
+        self.pending = 0
+        self._loop = None
+        self._wake = None
+        self._task = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        subscribe(self._on_change)
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        unsubscribe(self._on_change)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def _on_change(self, change):
+        # Resets mean changes may have been missed, so they count as a write
+        if change.table is not None and change.table not in ROLLUP_SOURCE_TABLES:
+            return
+        self.pending += 1
+        if self.after_writes and self.pending >= self.after_writes:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self.pending:
+                continue
+            pending, self.pending = self.pending, 0
+            try:
+                refreshed = await asyncio.to_thread(refresh_rollups)
+                logger.info("Rollup refresh after %d writes: %s", pending, "done" if refreshed else "skipped, in progress elsewhere")
+            except Exception:
+                self.pending += pending
+                logger.exception("Rollup refresh failed")
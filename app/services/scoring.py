@@ -0,0 +1,146 @@
+from collections.abc import Mapping
+from functools import reduce
+import operator
+import numpy as np
+from sqlalchemy import case, func, null
+
+# Sensory fields summed into Coffee.total_cup_points
+COFFEE_SCORE_FIELDS = (
+    'aroma', 'flavor', 'aftertaste', 'acidity', 'body',
+    'balance', 'uniformity', 'clean_cup', 'sweetness'
+)
+
+# Sensory fields summed into CuppingScore.total_score (defects are subtracted)
+CUPPING_SCORE_FIELDS = (
+    'fragrance_aroma', 'flavor', 'aftertaste', 'acidity', 'body',
+    'balance', 'uniformity', 'clean_cup', 'sweetness', 'overall'
+)
+
+# Quality classification thresholds on total_cup_points, highest first
+QUALITY_THRESHOLDS = (
+    (80, "Specialty"),
+    (70, "Premium"),
+)
+DEFAULT_CLASSIFICATION = "Standard"
+
+def _field(record, field):
+    if isinstance(record, Mapping):
+        return record.get(field)
+    return getattr(record, field)
+
+def _total(record, fields):
+    """
+    Sum fields left to right, or None if any of them is missing
+    """
+    total = None
+    for field in fields:
+        value = _field(record, field)
+        if value is None:
+            return None
+        total = value if total is None else total + value
+    return total
+
+def classify(total_cup_points):
+    """
+    Map total cup points to a quality classification
+    """
+    if total_cup_points is None:
+        return None
+    for threshold, classification in QUALITY_THRESHOLDS:
+        if total_cup_points >= threshold:
+            return classification
+    return DEFAULT_CLASSIFICATION
+
+def score_coffee(record):
+    """
+    Score one coffee (a mapping or an object with the score fields).
+    Returns (total_cup_points, quality_classification), both None when any score is missing.
+    """
+    total = _total(record, COFFEE_SCORE_FIELDS)
+    return total, classify(total)
+
+def score_cupping(record):
+    """
+    Score one cupping sheet, returning total_score or None when any score is missing.
+    Missing defects count as zero.
+    """
+    total = _total(record, CUPPING_SCORE_FIELDS)
+    if total is None:
+        return None
+    return total - (_field(record, 'defects') or 0)
+
+def columns_from_rows(rows, fields):
+    """
+    Turn a list of row mappings into float64 column arrays, with NaN for missing values
+    """
+    return {
+        field: np.array([row.get(field) for row in rows], dtype=np.float64)
+        for field in fields
+    }
+
+def _column_total(columns, fields):
+    total = np.asarray(columns[fields[0]], dtype=np.float64).copy()
+    for field in fields[1:]:
+        np.add(total, np.asarray(columns[field], dtype=np.float64), out=total)
+    return total
+
+def classify_batch(totals):
+    """
+    Classify an array of totals; NaN totals map to None
+    """
+    classifications = np.full(totals.shape, DEFAULT_CLASSIFICATION, dtype=object)
+    for threshold, classification in reversed(QUALITY_THRESHOLDS):
+        classifications[totals >= threshold] = classification
+    classifications[np.isnan(totals)] = None
+    return classifications
+
+def score_coffee_batch(columns):
+    """
+    Score a batch of coffees given as column arrays keyed by score field.
+    Returns (totals, classifications) arrays; rows with a missing score have a
+    NaN total and a None classification.
+    """
+    totals = _column_total(columns, COFFEE_SCORE_FIELDS)
+    return totals, classify_batch(totals)
+
+def score_cupping_batch(columns):
+    """
+    Score a batch of cupping sheets given as column arrays. Missing defects count
+    as zero; rows with any other missing score get a NaN total.
+    """
+    totals = _column_total(columns, CUPPING_SCORE_FIELDS)
+    if 'defects' in columns:
+        np.subtract(totals, np.nan_to_num(np.asarray(columns['defects'], dtype=np.float64)), out=totals)
+    return totals
+
+def to_optional_list(values):
+    """
+    Convert a scored array to Python values, with None in place of NaN
+    """
+    if values.dtype == object:
+        return values.tolist()
+    return [None if value != value else value for value in values.tolist()]
+
+def coffee_total_sql(entity):
+    """
+    SQL expression for total_cup_points over a Coffee entity or table columns.
+    NULL when any score is NULL, like score_coffee.
+    """
+    return reduce(operator.add, [getattr(entity, field) for field in COFFEE_SCORE_FIELDS])
+
+def cupping_total_sql(entity):
+    """
+    SQL expression for total_score over a CuppingScore entity or table columns
+    """
+    total = reduce(operator.add, [getattr(entity, field) for field in CUPPING_SCORE_FIELDS])
+    return total - func.coalesce(entity.defects, 0)
+
+def classify_sql(total):
+    """
+    SQL CASE expression applying QUALITY_THRESHOLDS to a total expression
+    """
+    return case(
+        (total.is_(None), null()),
+        *[(total >= threshold, classification) for threshold, classification in QUALITY_THRESHOLDS],
+        else_=DEFAULT_CLASSIFICATION
+    )
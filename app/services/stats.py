@@ -0,0 +1,105 @@
+from collections import namedtuple
+from sqlalchemy import Float, func, select
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from app.models.models import Country, Producer, Coffee, CuppingScore
+from app.services.scoring import COFFEE_SCORE_FIELDS, CUPPING_SCORE_FIELDS
+
+# Dimensions rows can be grouped and filtered by, over the coffees -> producers -> countries join
+GROUP_COLUMNS = {
+    "country": Country.country_name,
+    "region": Country.region,
+    "continent": Country.continent,
+    "variety": Coffee.variety,
+    "processing_method": Coffee.processing_method,
+    "harvest_year": Coffee.harvest_year,
+    "quality_classification": Coffee.quality_classification,
+}
+
+DEFAULT_PERCENTILES = (0.25, 0.5, 0.75)
+
+# entity: table aggregated; metrics: numeric columns allowed; score: column min/max_score filter on
+StatsSource = namedtuple("StatsSource", ["entity", "metrics", "score", "tables"])
+
+STATS_SOURCES = {
+    "coffees": StatsSource(
+        Coffee,
+        ("total_cup_points",) + COFFEE_SCORE_FIELDS + ("moisture_percentage", "quakers"),
+        "total_cup_points",
+        ("coffees", "producers", "countries"),
+    ),
+    "cupping_scores": StatsSource(
+        CuppingScore,
+        ("total_score",) + CUPPING_SCORE_FIELDS + ("defects",),
+        "total_score",
+        ("cupping_scores", "coffees", "producers", "countries"),
+    ),
+}
+
+def percentile_label(fraction):
+    return f"p{fraction * 100:g}"
+
+def stats_query(source, group_by=(), metrics=(), percentiles=DEFAULT_PERCENTILES, filters=None,
+                min_score=None, max_score=None):
+    """
+    One GROUP BY select computing count, mean, min, max, stddev and percentiles of
+    each metric per group. filters maps group dimensions to the value to keep.
+    """
+    source = STATS_SOURCES[source]
+    filters = filters or {}
+    columns = [GROUP_COLUMNS[name].label(name) for name in group_by]
+    columns.append(func.count().label("count"))
+    for name in metrics:
+        column = getattr(source.entity, name)
+        columns += [
+            func.count(column).label(f"{name}__count"),
+            func.avg(column).label(f"{name}__mean"),
+            func.min(column).label(f"{name}__min"),
+            func.max(column).label(f"{name}__max"),
+            func.stddev_samp(column).label(f"{name}__stddev"),
+        ]
+        if percentiles:
+            columns.append(
+                func.percentile_cont(array(percentiles), type_=ARRAY(Float))
+                .within_group(column)
+                .label(f"{name}__percentiles")
+            )
+
+    query = select(*columns).select_from(source.entity)
+    if source.entity is CuppingScore:
+        query = query.join(Coffee, Coffee.coffee_id == CuppingScore.coffee_id)
+    dimensions = set(group_by) | set(filters)
+    if dimensions & {"country", "region", "continent"}:
+        query = query.join(Producer, Producer.producer_id == Coffee.producer_id)
+        query = query.join(Country, Country.country_id == Producer.country_id)
+
+    for name, value in filters.items():
+        query = query.where(GROUP_COLUMNS[name] == value)
+    score = getattr(source.entity, source.score)
+    if min_score is not None:
+        query = query.where(score >= min_score)
+    if max_score is not None:
+        query = query.where(score <= max_score)
+
+    group_columns = [GROUP_COLUMNS[name] for name in group_by]
+    return query.group_by(*group_columns).order_by(*group_columns)
+
+def stats_groups(rows, group_by, metrics, percentiles):
+    """
+    Shape stats_query result rows into StatsGroup dicts
+    """
+    labels = [percentile_label(fraction) for fraction in percentiles]
+    groups = []
+    for row in rows:
+        values = {}
+        for name in metrics:
+            values[name] = {
+                stat: row[f"{name}__{stat}"] for stat in ("count", "mean", "min", "max", "stddev")
+            }
+            if percentiles:
+                values[name]["percentiles"] = dict(zip(labels, row[f"{name}__percentiles"] or [None] * len(labels)))
+        groups.append({
+            "group": {name: row[name] for name in group_by},
+            "count": row["count"],
+            "metrics": values,
+        })
+    return groups
@@ -0,0 +1,140 @@
+import asyncio
+import os
+from collections import deque
+from app.services.events import ORIGIN, subscribe, unsubscribe
+
+# Events kept for clients resuming with a last event id, and events a slow
+# client may fall behind by before it is disconnected
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", 1000))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 256))
+
+STREAM_TABLES = ("coffees", "cupping_scores")
+
+class StreamEvent:
+    __slots__ = ("id", "name", "data")
+
+    def __init__(self, event_id, name, data):
+        self.id = event_id
+        self.name = name
+        self.data = data
+
+class Subscription:
+    """
+    One client's bounded queue of live events, after the replay of those it missed.
+    None in the queue means the client fell too far behind and must reconnect (and
+    resume from its last event id).
+    """
+    def __init__(self, size, replay=()):
+        self.queue = asyncio.Queue(size)
+        self.replay = list(replay)
+
+    def push(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+        return True
+
+class ChangeStream:
+    """
+    Fans committed changes to tables out to any number of streaming clients from
+    the one process-wide change subscription (local commits plus the LISTEN
+    connection). Events get increasing ids, prefixed with this process's origin;
+    the last buffer_size are kept so a reconnecting client replays what it missed.
+    A client resuming from an id this process no longer has gets a reset event and
+    should reload instead.
+    """
+    def __init__(self, tables=STREAM_TABLES, buffer_size=STREAM_BUFFER_SIZE, queue_size=STREAM_QUEUE_SIZE):
+        self.tables = set(tables)
+        self.queue_size = queue_size
+        self.sequence = 0
+        self.buffer = deque(maxlen=buffer_size)
+        self.subscriptions = set()
+        self.dropped = 0
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        subscribe(self._on_change)
+        return self
+
+    def stop(self):
+        unsubscribe(self._on_change)
+        for subscription in list(self.subscriptions):
+            subscription.push(None)
+
+    def _on_change(self, change):
+        # Changes are dispatched from request threads and from the listener
+        if change.table is None or change.table in self.tables:
+            self._loop.call_soon_threadsafe(self._publish, change)
+
+    def _publish(self, change):
+        self.sequence += 1
+        if change.table is None:
+            event = StreamEvent(self.event_id(self.sequence), "reset", {})
+        else:
+            event = StreamEvent(self.event_id(self.sequence), "change", {
+                "table": change.table, "operation": change.operation, "id": change.row_id,
+            })
+        self.buffer.append((self.sequence, event))
+        for subscription in list(self.subscriptions):
+            if not subscription.push(event):
+                self.dropped += 1
+                self.subscriptions.discard(subscription)
+
+    def event_id(self, sequence):
+        return f"{ORIGIN}-{sequence}"
+
+    def _missed(self, last_event_id):
+        """
+        Buffered events after last_event_id, or a reset event when they are gone
+        """
+        origin, _, sequence = (last_event_id or "").rpartition("-")
+        if origin != ORIGIN or not sequence.isdigit() or int(sequence) > self.sequence:
+            return [StreamEvent(self.event_id(self.sequence), "reset", {})]
+        sequence = int(sequence)
+        if sequence < self.sequence and (not self.buffer or self.buffer[0][0] > sequence + 1):
+            return [StreamEvent(self.event_id(self.sequence), "reset", {})]
+        return [event for number, event in self.buffer if number > sequence]
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register a client; it first receives what it missed since last_event_id
+        """
+        subscription = Subscription(self.queue_size, self._missed(last_event_id) if last_event_id else ())
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    async def events(self, subscription, heartbeat):
+        """
+        Yield a client's events as they arrive, and None every heartbeat seconds
+        without one. Stops when the client fell behind.
+        """
+        try:
+            for event in subscription.replay:
+                yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscriptions),
+            "last_event_id": self.event_id(self.sequence),
+            "buffered": len(self.buffer),
+            "dropped_subscribers": self.dropped,
+        }
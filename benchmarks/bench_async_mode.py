@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Compare request throughput of the sync (thread pool) and async (asyncpg) SQL modes.
+
+Starts one single-worker uvicorn server per mode and fires concurrent GET requests
+at it. Requires httpx and a reachable DB_URI.
+
+    python -m benchmarks.bench_async_mode --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+async def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start")
+
+
+async def hammer(base_url, path, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                try:
+                    response = await client.get(path)
+                except httpx.TransportError:
+                    errors += 1
+                    return
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    return total / elapsed, errors
+
+
+def run_mode(async_mode, args, port):
+    env = dict(os.environ, DB_ASYNC="true" if async_mode else "false")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", "1", "--log-level", "warning"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(wait_until_ready(base_url))
+        asyncio.run(hammer(base_url, args.path, min(50, args.requests), args.concurrency))
+        return asyncio.run(hammer(base_url, args.path, args.requests, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--path", default="/api/coffees/?limit=20")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    for async_mode in (False, True):
+        label = "async" if async_mode else "sync"
+        rate, errors = run_mode(async_mode, args, args.port + int(async_mode))
+        print(f"{label:>5}: {rate:8.1f} req/s ({errors} errors)")
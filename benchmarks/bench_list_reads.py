@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Rows/sec of the list read path: ORM instances validated into response models versus Core rows.
+
+Fetches and serializes pages of coffees and cupping scores in-process, the way
+read_coffees and read_cupping_scores do, then compares the JSON response classes
+on a page of coffees. Requires a reachable, populated DB_URI.
+
+    python -m benchmarks.bench_list_reads --limit 100 --pages 300
+"""
+import argparse
+import time
+from typing import List
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.config.database import SessionLocal
+from app.models.models import Coffee, CuppingScore, CoffeeResponse, CuppingScoreResponse
+from app.routers.pagination import paginate, paginate_rows
+from app.routers import responses
+from app.routers.rows import select_rows, rows_response
+
+
+def orm_page(db, entity, model, id_column, limit):
+    adapter = TypeAdapter(List[model])
+
+    def page():
+        rows = paginate(db.query(entity), Response(), id_column, {id_column.key: id_column}, limit=limit)
+        body = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+        db.expunge_all()
+        return body
+    return page
+
+
+def core_page(db, entity, model, id_column, limit):
+    def page():
+        response = Response()
+        rows = paginate_rows(db, select_rows(entity, model), response, id_column, {id_column.key: id_column}, limit=limit)
+        return rows_response(model, rows, response).body
+    return page
+
+
+def serializers(db, limit):
+    """
+    Ways a response_model route turns a page into bytes: FastAPI's own pydantic
+    dump_json path, or a python dump rendered by a response class
+    """
+    adapter = TypeAdapter(List[CoffeeResponse])
+    models = adapter.validate_python(
+        paginate(db.query(Coffee), Response(), Coffee.coffee_id, {"coffee_id": Coffee.coffee_id}, limit=limit),
+        from_attributes=True
+    )
+    accelerator = responses.orjson
+
+    def render(response_class, orjson=accelerator):
+        def page():
+            responses.orjson = orjson
+            try:
+                return response_class(adapter.dump_python(models, mode="json")).body
+            finally:
+                responses.orjson = accelerator
+        return page
+
+    cases = [("pydantic dump_json", lambda: adapter.dump_json(models))]
+    if accelerator is not None:
+        cases.append(("FastJSONResponse, orjson", render(responses.FastJSONResponse)))
+    cases += [
+        ("FastJSONResponse, stdlib", render(responses.FastJSONResponse, None)),
+        ("JSONResponse", render(JSONResponse)),
+    ]
+    return cases
+
+
+def rate(page, limit, pages):
+    for _ in range(min(20, pages)):
+        page()
+    start = time.perf_counter()
+    for _ in range(pages):
+        page()
+    return pages * limit / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=300)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        for label, entity, model, id_column in (
+            ("coffees", Coffee, CoffeeResponse, Coffee.coffee_id),
+            ("cupping_scores", CuppingScore, CuppingScoreResponse, CuppingScore.score_id),
+        ):
+            orm = orm_page(db, entity, model, id_column, args.limit)
+            core = core_page(db, entity, model, id_column, args.limit)
+            if orm() != core():
+                raise SystemExit(f"{label}: ORM and Core bodies differ")
+            orm_rate = rate(orm, args.limit, args.pages)
+            core_rate = rate(core, args.limit, args.pages)
+            print(f"{label:>15}: ORM {orm_rate:10,.0f} rows/s, Core {core_rate:10,.0f} rows/s ({core_rate / orm_rate:.2f}x)")
+
+        print(f"coffee page serialization ({args.limit} rows):")
+        for label, page in serializers(db, args.limit):
+            print(f"{label:>28}: {rate(page, args.limit, args.pages * 10):12,.0f} rows/s")
+    finally:
+        db.close()
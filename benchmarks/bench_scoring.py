@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the scoring engine: per-record scoring versus the batch (column array) path.
+
+    python -m benchmarks.bench_scoring --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.scoring import (
+    COFFEE_SCORE_FIELDS, CUPPING_SCORE_FIELDS,
+    score_coffee, score_coffee_batch, score_cupping_batch
+)
+
+
+def random_columns(fields, rows, rng):
+    columns = {field: rng.uniform(5, 10, rows).round(2) for field in fields}
+    # Leave a few scores missing so the NaN handling is part of the measurement
+    columns[fields[0]][rng.integers(0, rows, rows // 100)] = np.nan
+    return columns
+
+
+def rate(func, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    coffee_columns = random_columns(COFFEE_SCORE_FIELDS, args.rows, rng)
+    cupping_columns = random_columns(CUPPING_SCORE_FIELDS, args.rows, rng)
+    cupping_columns["defects"] = rng.choice([0, 2, np.nan], args.rows)
+
+    single_rows = min(args.rows, 100_000)
+    records = [
+        {field: float(coffee_columns[field][i]) for field in COFFEE_SCORE_FIELDS}
+        for i in range(single_rows)
+    ]
+
+    results = [
+        ("coffee, per record", rate(lambda: [score_coffee(r) for r in records], single_rows, args.repeat)),
+        ("coffee, batch", rate(lambda: score_coffee_batch(coffee_columns), args.rows, args.repeat)),
+        ("cupping, batch", rate(lambda: score_cupping_batch(cupping_columns), args.rows, args.repeat)),
+    ]
+    for label, rows_per_second in results:
+        print(f"{label:>20}: {rows_per_second:14,.0f} rows/s")
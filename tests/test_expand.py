@@ -0,0 +1,121 @@
+"""
+The expand endpoints eager load related rows: the number of statements a request
+runs depends on the collections expanded, not on how many rows come back.
+Runs the API router in process against SQLite, without Postgres.
+"""
+import os
+
+os.environ.setdefault("DB_URI", "postgresql://localhost/coffee_quality")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ["DB_ASYNC"] = "false"
+os.environ["SINGLE_FLIGHT_ENABLED"] = "false"
+
+import itertools
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.config.database import get_db
+from app.models.models import Country, Producer, Coffee, CuppingScore
+from app.routers.api import router
+
+# app.main creates the Postgres schema on import, so the router is mounted on its own
+app = FastAPI()
+app.include_router(router, prefix="/api")
+
+TABLES = [entity.__table__ for entity in (Country, Producer, Coffee, CuppingScore)]
+countries = itertools.count()
+
+@pytest.fixture
+def database():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    for table in TABLES:
+        table.create(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    def get_test_db():
+        with Session() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = get_test_db
+    yield Session, statements
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+def seed(Session, producers, coffees_per_producer, scores_per_coffee):
+    with Session() as db:
+        country = Country(country_name=f"Country {next(countries)}")
+        db.add(country)
+        for p in range(producers):
+            producer = Producer(company_name=f"Producer {p}", farm_name=f"Farm {p}", country=country)
+            db.add(producer)
+            for c in range(coffees_per_producer):
+                coffee = Coffee(producer=producer, harvest_year=2020, lot_number=f"{p}-{c}", total_cup_points=80.0)
+                db.add(coffee)
+                for s in range(scores_per_coffee):
+                    db.add(CuppingScore(coffee=coffee, cupper_name=f"Cupper {s}", total_score=80.0))
+        db.commit()
+
+def count_statements(statements, url):
+    statements.clear()
+    response = TestClient(app).get(url)
+    assert response.status_code == 200, response.text
+    return len(statements), response.json()
+
+# expand, collections it loads (each costs one statement on top of the page's)
+COFFEE_CASES = [
+    ("producer", 0),
+    ("producer.country", 0),
+    ("producer.country,cupping_scores", 1),
+]
+PRODUCER_CASES = [
+    ("country", 0),
+    ("coffees", 1),
+    ("country,coffees.cupping_scores", 2),
+]
+
+@pytest.mark.parametrize("expand,collections", COFFEE_CASES)
+def test_coffee_list_statements_do_not_grow_with_rows(database, expand, collections):
+    Session, statements = database
+    seed(Session, producers=2, coffees_per_producer=2, scores_per_coffee=1)
+    small, body = count_statements(statements, f"/api/coffees/?expand={expand}")
+    assert len(body) == 4
+
+    seed(Session, producers=10, coffees_per_producer=5, scores_per_coffee=4)
+    large, body = count_statements(statements, f"/api/coffees/?expand={expand}")
+    assert len(body) == 54
+    assert small == large == 1 + collections
+
+@pytest.mark.parametrize("expand,collections", PRODUCER_CASES)
+def test_producer_list_statements_do_not_grow_with_rows(database, expand, collections):
+    Session, statements = database
+    seed(Session, producers=2, coffees_per_producer=1, scores_per_coffee=1)
+    small, body = count_statements(statements, f"/api/producers/?expand={expand}")
+    assert len(body) == 2
+
+    seed(Session, producers=20, coffees_per_producer=5, scores_per_coffee=3)
+    large, body = count_statements(statements, f"/api/producers/?expand={expand}")
+    assert len(body) == 22
+    assert small == large == 1 + collections
+
+def test_expanded_rows_are_nested(database):
+    Session, statements = database
+    seed(Session, producers=3, coffees_per_producer=2, scores_per_coffee=2)
+    _, body = count_statements(statements, "/api/producers/?expand=country,coffees.cupping_scores")
+    assert all(producer["country"]["country_name"].startswith("Country") for producer in body)
+    assert [len(producer["coffees"]) for producer in body] == [2, 2, 2]
+    assert all(len(coffee["cupping_scores"]) == 2 for producer in body for coffee in producer["coffees"])
+
+def test_coffee_detail_statements_do_not_grow_with_scores(database):
+    Session, statements = database
+    seed(Session, producers=1, coffees_per_producer=1, scores_per_coffee=1)
+    seed(Session, producers=1, coffees_per_producer=1, scores_per_coffee=30)
+    few, body = count_statements(statements, "/api/coffees/1?expand=producer.country,cupping_scores")
+    assert len(body["cupping_scores"]) == 1
+    many, body = count_statements(statements, "/api/coffees/2?expand=producer.country,cupping_scores")
+    assert len(body["cupping_scores"]) == 30
+    assert few == many == 2
@@ -0,0 +1,100 @@
+"""
+The shared scoring engine gives the same totals and classifications as the
+per-record code it replaced, on the single record, batch and SQL paths,
+including totals exactly on and just below the thresholds.
+"""
+import random
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, Table, create_engine, insert, select
+from app.services.scoring import (
+    COFFEE_SCORE_FIELDS, CUPPING_SCORE_FIELDS, classify_sql, columns_from_rows, score_coffee,
+    score_coffee_batch, score_cupping, score_cupping_batch, to_optional_list
+)
+
+def legacy_coffee_score(record):
+    # The create/update handlers before the scoring engine: summed left to right,
+    # >= 80 Specialty, >= 70 Premium, else Standard, nothing when a score is missing
+    if any(record.get(field) is None for field in COFFEE_SCORE_FIELDS):
+        return None, None
+    total = record['aroma'] + record['flavor'] + record['aftertaste'] + record['acidity'] + record['body'] \
+        + record['balance'] + record['uniformity'] + record['clean_cup'] + record['sweetness']
+    if total >= 80:
+        return total, "Specialty"
+    elif total >= 70:
+        return total, "Premium"
+    return total, "Standard"
+
+def legacy_cupping_score(record):
+    if any(record.get(field) is None for field in CUPPING_SCORE_FIELDS):
+        return None
+    defects = record.get('defects') or 0
+    return record['fragrance_aroma'] + record['flavor'] + record['aftertaste'] + record['acidity'] \
+        + record['body'] + record['balance'] + record['uniformity'] + record['clean_cup'] \
+        + record['sweetness'] + record['overall'] - defects
+
+def coffee(*scores):
+    return dict(zip(COFFEE_SCORE_FIELDS, scores))
+
+def spread(total):
+    # Nine scores summing to total with float steps, the last one taking the remainder
+    scores = [round(total / 9, 2)] * 8
+    return coffee(*scores, total - sum(scores))
+
+# Totals exactly on, just above and just below each threshold, plus missing scores
+BOUNDARY_COFFEES = [
+    coffee(9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 8.0),
+    coffee(8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 6.0),
+    coffee(9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 7.99),
+    coffee(8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 8.0, 5.99),
+    coffee(8.89, 8.89, 8.89, 8.89, 8.89, 8.89, 8.89, 8.89, 8.88),
+    coffee(7.78, 7.78, 7.78, 7.78, 7.78, 7.78, 7.78, 7.78, 7.76),
+    spread(80.0), spread(70.0), spread(80.000001), spread(69.999999),
+    coffee(0, 0, 0, 0, 0, 0, 0, 0, 0),
+    coffee(10, 10, 10, 10, 10, 10, 10, 10, 10),
+    coffee(9.0, 9.0, 9.0, None, 9.0, 9.0, 9.0, 9.0, 9.0),
+    coffee(9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 9.0, 9.0),
+]
+
+def random_coffees(count, seed=4):
+    generator = random.Random(seed)
+    return [coffee(*[round(generator.uniform(6.0, 10.0), 2) for _ in COFFEE_SCORE_FIELDS]) for _ in range(count)]
+
+COFFEES = BOUNDARY_COFFEES + random_coffees(2000)
+
+def test_boundaries_classify_as_before():
+    classifications = [legacy_coffee_score(record)[1] for record in BOUNDARY_COFFEES[:4]]
+    assert classifications == ["Specialty", "Premium", "Premium", "Standard"]
+
+@pytest.mark.parametrize("record", BOUNDARY_COFFEES)
+def test_score_coffee_matches_legacy(record):
+    assert score_coffee(record) == legacy_coffee_score(record)
+
+def test_score_coffee_batch_matches_legacy():
+    totals, classifications = score_coffee_batch(columns_from_rows(COFFEES, COFFEE_SCORE_FIELDS))
+    expected = [legacy_coffee_score(record) for record in COFFEES]
+    assert list(zip(to_optional_list(totals), to_optional_list(classifications))) == expected
+
+def test_classify_sql_matches_legacy():
+    metadata = MetaData()
+    totals = Table("totals", metadata, Column("id", Integer, primary_key=True), Column("total", Float))
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    expected = [legacy_coffee_score(record) for record in COFFEES]
+    with engine.begin() as connection:
+        connection.execute(insert(totals), [{"id": index, "total": total} for index, (total, _) in enumerate(expected)])
+        rows = connection.execute(select(classify_sql(totals.c.total)).order_by(totals.c.id)).scalars().all()
+    assert rows == [classification for _, classification in expected]
+
+def test_score_cupping_matches_legacy():
+    generator = random.Random(18)
+    records = [
+        {**{field: round(generator.uniform(6.0, 10.0), 2) for field in CUPPING_SCORE_FIELDS},
+         "defects": generator.choice([None, 0, 2.0, 4.5])}
+        for _ in range(500)
+    ]
+    records.append({field: 8.0 for field in CUPPING_SCORE_FIELDS[:-1]})
+    expected = [legacy_cupping_score(record) for record in records]
+
+    assert [score_cupping(record) for record in records] == expected
+    columns = columns_from_rows(records, CUPPING_SCORE_FIELDS + ('defects',))
+    assert to_optional_list(score_cupping_batch(columns)) == expected